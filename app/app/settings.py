@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -125,6 +126,9 @@ STATIC_URL = '/static/static/'
 MEDAI_URL = '/static/media/'
 
 MEDIA_ROOT = '/vol/web/media/'
+
+# Uploaded files are named by content hash, so duplicates are stored once.
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
 STATIC_ROOT = '/vol/web/static/'
 
 # Default primary key field type
@@ -141,6 +145,64 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',  # to generate schema
 }
 
+# Default number of items per page on list endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 25))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+    # Serialized list responses. Point API_CACHE_BACKEND at
+    # recipe.cache.MeteredFileBasedCache, or a memcached or redis backend,
+    # to share entries between worker processes.
+    'api': {
+        'BACKEND': os.environ.get('API_CACHE_BACKEND',
+                                  'recipe.cache.MeteredLocMemCache'),
+        'LOCATION': os.environ.get('API_CACHE_LOCATION', 'recipe-api'),
+        'TIMEOUT': int(os.environ.get('API_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('API_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+    # Resolved API tokens. Only used with a backend shared by all worker
+    # processes, such as memcached, so revocations reach every worker.
+    'auth': {
+        'BACKEND': os.environ.get(
+            'AUTH_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('AUTH_CACHE_LOCATION', 'auth-tokens'),
+    },
+    # Counters of the list cache. Point METRICS_CACHE_BACKEND at a backend
+    # shared by all worker processes with atomic increments, such as
+    # memcached, so the reported metrics cover every worker.
+    'metrics': {
+        'BACKEND': os.environ.get(
+            'METRICS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('METRICS_CACHE_LOCATION', 'metrics'),
+    },
+}
+
+API_CACHE_ALIAS = 'api'
+METRICS_CACHE_ALIAS = 'metrics'
+
+# Limits of recipe image uploads, checked while the upload streams in.
+# Keep the byte limit in line with client_max_body_size in the proxy.
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000))
+
+# Resolved API tokens are cached for this many seconds, unless the cache
+# is local to the process, see users.authentication.
+AUTH_TOKEN_CACHE_ALIAS = 'auth'
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+
 # SWAGGER SETTINGS
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
+
+from recipe.images import enqueue_renditions
 from .models import (User,
+                     ImageBlob,
                      Recipe,
+                     RecipeImageJob,
                      Tag,
                      Ingredient)
 
@@ -42,7 +46,25 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
-admin.site.register(Recipe)
+@admin.register(Recipe)
+class RecipeAdmin(admin.ModelAdmin):
+
+    def save_model(self, request, obj, form, change):
+        """Keep image reference counts and renditions in sync"""
+        previous = Recipe.objects.get(pk=obj.pk).image.name if change else None
+        super().save_model(request, obj, form, change)
+        if obj.image.name != previous:
+            ImageBlob.objects.acquire([obj.image.name])
+            ImageBlob.objects.release([previous])
+            if obj.image:
+                enqueue_renditions(obj)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.update_search_vectors([form.instance.pk])
+
+
+admin.site.register(RecipeImageJob)
 
 admin.site.register(Tag)
 admin.site.register(Ingredient)
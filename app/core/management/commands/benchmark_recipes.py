@@ -0,0 +1,260 @@
+"""
+Django Command To Benchmark The Recipe API On A Seeded Dataset
+"""
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from core.models import (PantryEntry,
+                         Recipe,
+                         RecipeSimilarity,
+                         Tag,
+                         Ingredient,
+                         )
+from recipe.cache import get_list_cache
+
+BENCHMARK_EMAIL = 'benchmark-{}@example.com'
+TAGS_PER_USER = 50
+INGREDIENTS_PER_USER = 500
+TAGS_PER_RECIPE = 3
+INGREDIENTS_PER_RECIPE = 8
+SEED_BATCH_SIZE = 10000
+
+LINK_SQL = '''
+    INSERT INTO {through} (recipe_id, {column})
+    SELECT r.id, a.id
+    FROM core_recipe r
+    CROSS JOIN generate_series(0, %(per_recipe)s - 1) AS j
+    JOIN (
+        SELECT id, user_id,
+               row_number() OVER (PARTITION BY user_id ORDER BY id) - 1 AS n
+        FROM {table}
+        WHERE user_id = ANY(%(users)s)
+    ) a ON a.user_id = r.user_id
+       AND a.n = (r.id * 7 + j * 13) %% %(per_user)s
+    WHERE r.user_id = ANY(%(users)s)
+    ON CONFLICT DO NOTHING
+'''
+
+
+def scenarios(user):
+    """Return (name, url, query params) tuples to time for a user"""
+    recipes = reverse('recipe:recipe-list')
+    tags = reverse('recipe:tag-list')
+    ingredients = reverse('recipe:ingredient-list')
+    tag_ids = ','.join(
+        str(pk) for pk in
+        Tag.objects.filter(user=user).values_list('id', flat=True)[:2]
+    )
+    # Seeded recipe i links ingredients (7i + 13j) % 500 in id order.
+    ingredient_pks = list(Ingredient.objects.filter(
+        user=user).order_by('id').values_list('id', flat=True))
+    ingredient_ids = ','.join(str(pk) for pk in ingredient_pks[:2])
+    first = Recipe.objects.filter(user=user).order_by('id').first()
+    similar = reverse('recipe:recipe-similar', args=[first.id])
+    # Lists are built ahead of requests, off the request path.
+    RecipeSimilarity.objects.build(first)
+
+    return [
+        ('recipe list', recipes, {}),
+        ('recipe list, 100 per page', recipes, {'page_size': 100}),
+        ('recipe list, id and title only', recipes, {'fields': 'id,title'}),
+        ('recipe list, 100 per page, id and title only', recipes,
+         {'page_size': 100, 'fields': 'id,title'}),
+        ('recipe list, 100 per page, ids of links', recipes,
+         {'page_size': 100, 'expand': ''}),
+        ('recipe list by tags', recipes, {'tags': tag_ids}),
+        ('recipe list by ingredients', recipes,
+         {'ingredients': ingredient_ids}),
+        ('recipe list with all of 3 ingredients', recipes,
+         {'ingredients_all': ','.join(
+             str(pk) for pk in ingredient_pks[0:39:13])}),
+        ('recipe list with all of 8 ingredients', recipes,
+         {'ingredients_all': ','.join(
+             str(pk) for pk in ingredient_pks[0:104:13])}),
+        ('recipe list without 20 ingredients', recipes,
+         {'ingredients_exclude': ','.join(
+             str(pk) for pk in ingredient_pks[:20])}),
+        ('recipe list under 30 minutes and 10, cheapest first', recipes,
+         {'max_time': 30, 'max_price': '10', 'ordering': 'price'}),
+        ('recipe list by title', recipes, {'ordering': 'title'}),
+        ('recipe list slowest first', recipes, {'ordering': '-time_minutes'}),
+        ('recipe search', recipes, {'search': 'recipe 4242'}),
+        ('recipe search, common term', recipes, {'search': 'tag 13'}),
+        ('ingredient typeahead', ingredients, {'q': 'ingredient 4'}),
+        ('similar recipes', similar, {}),
+        ('tag list', tags, {}),
+        ('tag list, assigned only', tags, {'assigned_only': 1}),
+        ('ingredient list', ingredients, {}),
+        ('ingredient list, most used first', ingredients,
+         {'ordering': 'usage'}),
+        ('user stats', reverse('recipe:stats'), {}),
+    ]
+
+
+def post_scenarios(user):
+    """Return (name, url, JSON body) tuples to time for a user"""
+    pantry = reverse('recipe:recipe-pantry')
+    shopping_list = reverse('recipe:recipe-shopping-list')
+    ingredient_pks = list(Ingredient.objects.filter(
+        user=user).order_by('id').values_list('id', flat=True))
+    recipe_pks = list(Recipe.objects.filter(
+        user=user).order_by('-id').values_list('id', flat=True)[:200])
+
+    return [
+        (f'pantry match, {size} ingredients', pantry,
+         {'ingredients': ingredient_pks[0:size * 7:7]})
+        for size in (5, 20, 60)
+    ] + [
+        ('shopping list, 200 recipes', shopping_list,
+         {'recipes': recipe_pks}),
+    ]
+
+
+class Command(BaseCommand):
+    """Django Command to time API requests against a large dataset"""
+    help = ('Seed benchmark users with recipes, then time list '
+            'requests through the API views.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000,
+                            help='Total recipes to seed.')
+        parser.add_argument('--users', type=int, default=10,
+                            help='Benchmark users sharing the recipes.')
+        parser.add_argument('--runs', type=int, default=20,
+                            help='Timed runs per scenario.')
+        parser.add_argument('--explain', action='store_true',
+                            help='Print the plan of the slowest query of '
+                                 'each scenario.')
+
+    def _seed(self, users, total):
+        """Seed users with recipes, tags and ingredients when missing"""
+        per_user = total // len(users)
+        seeded = False
+        for user in users:
+            existing = Recipe.objects.filter(user=user).count()
+            if existing >= per_user:
+                continue
+
+            seeded = True
+            self.stdout.write(f'Seeding {per_user - existing} recipes '
+                              f'for {user.email}...')
+            Tag.objects.get_or_create_by_names(
+                user, [f'Tag {i}' for i in range(TAGS_PER_USER)])
+            Ingredient.objects.get_or_create_by_names(
+                user, [f'Ingredient {i}' for i in range(INGREDIENTS_PER_USER)])
+            for start in range(existing, per_user, SEED_BATCH_SIZE):
+                Recipe.objects.bulk_create([
+                    Recipe(
+                        user=user,
+                        title=f'Recipe {i}',
+                        description='Benchmark recipe',
+                        time_minutes=5 + i % 120,
+                        price=Decimal(i % 5000) / 100,
+                    )
+                    for i in range(start, min(start + SEED_BATCH_SIZE,
+                                              per_user))
+                ])
+
+        if not seeded:
+            return
+
+        self.stdout.write('Linking tags and ingredients...')
+        user_ids = [user.id for user in users]
+        with connection.cursor() as cursor:
+            for model, field_name, per_recipe, per_user in (
+                (Tag, 'tags', TAGS_PER_RECIPE, TAGS_PER_USER),
+                (Ingredient, 'ingredients', INGREDIENTS_PER_RECIPE,
+                 INGREDIENTS_PER_USER),
+            ):
+                field = Recipe._meta.get_field(field_name)
+                cursor.execute(LINK_SQL.format(
+                    through=field.remote_field.through._meta.db_table,
+                    column=field.m2m_reverse_name(),
+                    table=model._meta.db_table,
+                ), {
+                    'users': user_ids,
+                    'per_recipe': per_recipe,
+                    'per_user': per_user,
+                })
+        for model in (Tag, Ingredient):
+            model.objects.recount_usage(
+                model.objects.filter(user__in=users).values('id'))
+        PantryEntry.objects.refresh(
+            Recipe.objects.filter(user__in=users).values('id'))
+        self.stdout.write('Indexing search vectors...')
+        Recipe.objects.update_search_vectors(
+            Recipe.objects.filter(user__in=users).values('id'))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _time(self, token, method, url, params, runs):
+        """Return request timings in ms and the queries of the last run"""
+        factory = APIRequestFactory()
+        match = resolve(url)
+        timings = []
+        for _ in range(runs):
+            # Time the database and serialization, not the list cache.
+            get_list_cache().clear()
+            extra = {'format': 'json'} if method == 'post' else {}
+            request = getattr(factory, method)(
+                url, params, HTTP_AUTHORIZATION=f'Token {token.key}',
+                **extra)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                match.func(request, *match.args, **match.kwargs).render()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        return timings, queries.captured_queries
+
+    def _explain(self, sql):
+        """Print the analyzed plan of a captured query"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN ANALYZE {sql}')
+            for (line,) in cursor.fetchall():
+                self.stdout.write(f'    {line}')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        users = []
+        for i in range(options['users']):
+            email = BENCHMARK_EMAIL.format(i)
+            user = get_user_model().objects.filter(email=email).first()
+            users.append(user or get_user_model().objects.create_user(
+                email, 'benchmark'))
+
+        with transaction.atomic():
+            self._seed(users, options['recipes'])
+
+        user = users[0]
+        self.stdout.write(
+            f'{Recipe.objects.count()} recipes in the database, '
+            f'{Recipe.objects.filter(user=user).count()} for {user.email}.'
+        )
+        token, _ = Token.objects.get_or_create(user=user)
+        with override_settings(ALLOWED_HOSTS=['*']):
+            requests = (
+                [('get', *scenario) for scenario in scenarios(user)]
+                + [('post', *scenario) for scenario in post_scenarios(user)]
+            )
+            for method, name, url, params in requests:
+                timings, queries = self._time(
+                    token, method, url, params, options['runs'])
+                timings.sort()
+                self.stdout.write(
+                    f'{name:<40} '
+                    f'median {statistics.median(timings):8.2f} ms  '
+                    f'p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms  '
+                    f'{len(queries)} queries'
+                )
+                if options['explain']:
+                    slowest = max(queries, key=lambda q: float(q['time']))
+                    self._explain(slowest['sql'])
@@ -0,0 +1,49 @@
+"""
+Django Command To Precompute Similar Recipes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import Recipe, RecipeSimilarity
+
+
+class Command(BaseCommand):
+    """Django Command to build the lists of similar recipes"""
+    help = ('Compute the most similar recipes of every recipe missing its '
+            'list or with a stale one, one recipe at a time, so memory '
+            'stays bounded however large the catalog is.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email of the only user to build.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild the lists already stored too.')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep rebuilding lists as they go stale.')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait when no list is stale.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        recipes = Recipe.objects.only('id').order_by('id')
+        if options['user']:
+            recipes = recipes.filter(user__email=options['user'])
+        if not options['rebuild']:
+            recipes = recipes.filter(Q(recipesimilarity__isnull=True)
+                                     | Q(recipesimilarity__stale=True))
+
+        built = 0
+        for recipe in recipes.iterator():
+            RecipeSimilarity.objects.build(recipe)
+            built += 1
+
+        while options['follow']:
+            if RecipeSimilarity.objects.build_next():
+                built += 1
+            else:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Built {built} similar recipe lists.')
+        )
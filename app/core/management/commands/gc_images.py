@@ -0,0 +1,118 @@
+"""
+Django Command To Delete Unreferenced Recipe Images
+"""
+import os
+from datetime import timedelta
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import ImageBlob, Recipe
+
+IMAGE_DIR = 'uploads/recipe'
+# Files checked and deleted under one lock of their rows.
+BATCH_SIZE = 1000
+
+
+def walk_files(storage, path):
+    """Yield the names of every file below path"""
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield os.path.join(path, name)
+    for directory in directories:
+        yield from walk_files(storage, os.path.join(path, directory))
+
+
+def batches(names, size=BATCH_SIZE):
+    """Yield lists of at most size names"""
+    names = iter(names)
+    while batch := list(islice(names, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    """Django Command to sweep image files no recipe references"""
+    help = ('Delete stored recipe images and renditions that no recipe '
+            'references and drop their reference counts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=24 * 60 * 60,
+                            help='Keep files modified within these seconds.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be deleted.')
+
+    def used_names(self, names):
+        """Return the names a recipe shows as its image or a rendition"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT DISTINCT used.name FROM {Recipe._meta.db_table}, '
+                f'LATERAL (SELECT image UNION ALL SELECT value '
+                f'FROM jsonb_each_text(image_renditions)) AS used(name) '
+                f"WHERE image <> '' AND used.name = ANY(%s)",
+                [names],
+            )
+            return {name for name, in cursor.fetchall()}
+
+    def sweep(self, names, dry_run):
+        """Delete the files and counts of names no recipe uses
+
+        The rows of the files are locked first. An upload storing one of
+        the files holds that lock until it commits, so a recipe about to
+        use a file is seen before the file is deleted. Returns the number
+        of files deleted, their bytes and the number of counts dropped.
+        """
+        storage = default_storage
+        with transaction.atomic():
+            counted = set(ImageBlob.objects.filter(
+                name__in=names).values_list('name', flat=True))
+            ImageBlob.objects.lock(names)
+            used = self.used_names(names)
+            unused = [name for name in names if name not in used]
+            files = [name for name in unused if storage.exists(name)]
+            freed = sum(storage.size(name) for name in files)
+            dropped = len(counted.intersection(unused))
+            # Files in use without a count stay uncounted.
+            ImageBlob.objects.filter(
+                name__in=used - counted, references=0).delete()
+            ImageBlob.objects.filter(name__in=unused).delete()
+            if dry_run:
+                transaction.set_rollback(True)
+            else:
+                for name in files:
+                    storage.delete(name)
+
+        return len(files), freed, dropped
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        storage = default_storage
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+
+        # Files being uploaded right now may not be referenced yet.
+        files = []
+        if storage.exists(IMAGE_DIR):
+            files = (name for name in walk_files(storage, IMAGE_DIR)
+                     if storage.get_modified_time(name) <= cutoff)
+        # Counts may outlive their files.
+        missing = (name for name in ImageBlob.objects.values_list(
+            'name', flat=True).iterator() if not storage.exists(name))
+
+        deleted = freed = dropped = 0
+        for names in batches(files):
+            batch_deleted, batch_freed, batch_dropped = self.sweep(
+                names, dry_run)
+            deleted += batch_deleted
+            freed += batch_freed
+            dropped += batch_dropped
+        for names in batches(missing):
+            dropped += self.sweep(names, dry_run)[2]
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} image files ({freed} bytes) and '
+            f'{dropped} reference counts.'
+        ))
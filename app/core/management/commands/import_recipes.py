@@ -0,0 +1,91 @@
+"""
+Django Command To Import Recipes From An NDJSON Or CSV File
+"""
+import csv
+import os
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.imports import BATCH_SIZE, RecipeImporter, read_rows
+
+
+class Command(BaseCommand):
+    """Django Command to stream recipes into a user's library"""
+    help = 'Import recipes for a user from an NDJSON or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin.')
+        parser.add_argument('--user', required=True,
+                            help='Email of the user owning the recipes.')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Input format, by default from the file '
+                                 'extension.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Rows written per transaction.')
+        parser.add_argument('--checkpoint',
+                            help='File recording the rows committed so far, '
+                                 'used to resume after a failure.')
+
+    def _read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    def _write_checkpoint(self, path, done):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            checkpoint.write(str(done))
+        os.replace(tmp_path, path)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'ndjson'
+        )
+        checkpoint = options['checkpoint']
+        start = self._read_checkpoint(checkpoint)
+        if start:
+            self.stdout.write(f'Resuming after row {start}...')
+
+        importer = RecipeImporter(user, batch_size=options['batch_size'])
+        started = time.monotonic()
+
+        def report(done):
+            if checkpoint:
+                self._write_checkpoint(checkpoint, done)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{done} rows processed '
+                f'({(done - start) / elapsed:.0f} rows/s)'
+            )
+
+        stream = (sys.stdin if path == '-'
+                  else open(path, newline='', encoding='utf-8'))
+        try:
+            importer.run(read_rows(stream, file_format), start=start,
+                         on_batch=report)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f'Could not read {path}: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for error in importer.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} recipes, '
+            f'skipped {importer.failed} invalid rows.'
+        ))
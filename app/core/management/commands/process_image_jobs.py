@@ -0,0 +1,35 @@
+"""
+Django Command To Generate Recipe Image Renditions In The Background
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe.images import process_next_job
+
+
+class Command(BaseCommand):
+    """Django Command to work through queued image jobs"""
+    help = ('Generate the renditions of uploaded recipe images. Run '
+            'several copies to process jobs in parallel.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is pending.')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait when no job is pending.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        processed = 0
+        while True:
+            if process_next_job():
+                processed += 1
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {processed} image jobs.')
+        )
@@ -0,0 +1,36 @@
+"""
+Django Command To Rebuild User Stats And Usage Counts
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Ingredient, Tag, UserStats
+
+
+class Command(BaseCommand):
+    """Django Command to recompute the counters from recipes and links"""
+    help = ('Recompute the recipe counters of users and the usage counts '
+            'of their tags and ingredients.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user',
+                            help='Email of the only user to rebuild.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        users = get_user_model().objects.all()
+        if options['user']:
+            users = users.filter(email=options['user'])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist.")
+
+        with transaction.atomic():
+            UserStats.objects.rebuild(users)
+            for model in (Tag, Ingredient):
+                model.objects.recount_usage(
+                    model.objects.filter(user__in=users).values('id'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the stats of {users.count()} users.'
+        ))
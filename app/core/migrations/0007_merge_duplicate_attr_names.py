@@ -0,0 +1,52 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:20
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge tags and ingredients sharing a name into the oldest row"""
+    Recipe = apps.get_model('core', 'Recipe')
+
+    for model_name, field_name in (('Tag', 'tags'),
+                                   ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field_name).through
+        fk = f'{model_name.lower()}_id'
+
+        duplicates = model.objects.values('user_id', 'name').annotate(
+            keep_id=Min('id'),
+            total=Count('id'),
+        ).filter(total__gt=1)
+
+        for duplicate in duplicates:
+            keep_id = duplicate['keep_id']
+            drop_ids = list(model.objects.filter(
+                user_id=duplicate['user_id'],
+                name=duplicate['name'],
+            ).exclude(id=keep_id).values_list('id', flat=True))
+
+            linked = through.objects.filter(**{fk: keep_id}).values_list(
+                'recipe_id', flat=True)
+            relink = through.objects.filter(
+                **{f'{fk}__in': drop_ids}
+            ).exclude(recipe_id__in=linked).values_list(
+                'recipe_id', flat=True).distinct()
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{fk: keep_id})
+                for recipe_id in relink
+            ])
+
+            model.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names,
+                             migrations.RunPython.noop),
+    ]
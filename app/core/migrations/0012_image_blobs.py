@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:01
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_image_references(apps, schema_editor):
+    """Count the references of images stored before counting started"""
+    Recipe = apps.get_model('core', 'Recipe')
+    ImageBlob = apps.get_model('core', 'ImageBlob')
+
+    counts = Counter()
+    rows = Recipe.objects.exclude(image__isnull=True).exclude(
+        image='').values_list('image', 'image_renditions')
+    for image, renditions in rows.iterator():
+        counts[image] += 1
+        counts.update(renditions.values())
+
+    ImageBlob.objects.bulk_create([
+        ImageBlob(name=name, references=count)
+        for name, count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_image_references,
+                             migrations.RunPython.noop),
+    ]
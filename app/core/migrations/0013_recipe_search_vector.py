@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:06
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Index the recipes written before search vectors existed"""
+    Recipe = apps.get_model('core', 'Recipe')
+
+    def linked_names(field_name, obj_col):
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        return models.Subquery(
+            through.objects.filter(
+                recipe=models.OuterRef('pk'),
+            ).values('recipe').annotate(
+                names=StringAgg(f'{obj_col}__name', ' '),
+            ).values('names')
+        )
+
+    Recipe.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector(linked_names('tags', 'tag'), weight='B',
+                       config='english')
+        + SearchVector(linked_names('ingredients', 'ingredient'),
+                       weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:14
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_usage(apps, schema_editor):
+    """Count the recipes linked to existing tags and ingredients"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for field_name in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        obj_col = field.m2m_reverse_name()
+        field.related_model.objects.update(usage_count=Coalesce(
+            models.Subquery(
+                through.objects.filter(
+                    **{obj_col: models.OuterRef('pk')}
+                ).values(obj_col).annotate(
+                    count=models.Count('*')
+                ).values('count')
+            ),
+            0,
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', config='simple'), name='ingredient_name_words_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('name', config='simple'), name='tag_name_words_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_pantry_entries(apps, schema_editor):
+    """Copy the existing recipe ingredients with their recipe's count"""
+    Recipe = apps.get_model('core', 'Recipe')
+    PantryEntry = apps.get_model('core', 'PantryEntry')
+    through = Recipe._meta.get_field('ingredients').remote_field.through
+    rows = through.objects.annotate(
+        count=models.Window(models.Count('*'),
+                            partition_by=[models.F('recipe_id')]),
+    ).values_list('ingredient_id', 'recipe_id', 'count')
+    sql, params = rows.query.sql_with_params()
+    schema_editor.execute(
+        f'INSERT INTO {PantryEntry._meta.db_table} '
+        f'(ingredient_id, recipe_id, ingredient_count) {sql}',
+        params,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_attr_usage_and_typeahead'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_count', models.PositiveSmallIntegerField()),
+                ('ingredient', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.ingredient')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.recipe')),
+            ],
+        ),
+        migrations.RunPython(fill_pantry_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pantryentry',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'recipe'), include=('ingredient_count',), name='unique_pantry_entry'),
+        ),
+    ]
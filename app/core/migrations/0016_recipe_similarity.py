@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:33
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_pantry_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.recipe')),
+                ('similar_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None)),
+                ('scores', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['similar_ids'], name='recipe_similar_ids_idx'),
+        ),
+    ]
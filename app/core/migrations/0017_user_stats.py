@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_user_stats(apps, schema_editor):
+    """Count the existing recipes of every user"""
+    Recipe = apps.get_model('core', 'Recipe')
+    UserStats = apps.get_model('core', 'UserStats')
+    rows = Recipe.objects.values('user_id').annotate(
+        recipe_count=models.Count('*'),
+        total_time_minutes=models.Sum('time_minutes'),
+        total_price=models.Sum('price'),
+    ).order_by()
+    UserStats.objects.bulk_create([UserStats(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipe_count', models.PositiveIntegerField(default=0)),
+                ('total_time_minutes', models.BigIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-usage_count'], name='ingredient_user_usage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-usage_count'], name='tag_user_usage_idx'),
+        ),
+    ]
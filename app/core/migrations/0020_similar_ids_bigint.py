@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:36
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_attr_name_trigrams'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipesimilarity',
+            name='similar_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_similar_ids_bigint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipesimilarity',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipesimilarity',
+            index=models.Index(condition=models.Q(('stale', True)), fields=['recipe'], name='recipe_similar_stale_idx'),
+        ),
+    ]
@@ -1,9 +1,20 @@
 """
 Database Models
 """
-import uuid
+import heapq
 import os
-from django.db import models
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.exceptions import EmptyResultSet
+from django.core.files.storage import default_storage
+from django.db import connections, models, transaction
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -12,12 +23,57 @@ from django.contrib.auth.models import (
 from django.conf import settings
 
 
+# Text search configuration of recipe search vectors and queries.
+SEARCH_CONFIG = 'english'
+# Number of similar recipes kept for each recipe.
+SIMILAR_RECIPES_KEPT = 10
+# Recipe fields summed in each user's stats.
+STATS_FIELDS = ('time_minutes', 'price')
+
+
+def name_words():
+    """Return the words of a tag or ingredient name, for typeahead"""
+    return SearchVector('name', config='simple')
+
+
 def recipe_image_file_path(instance, filename):
-    """Generate file path for new recipe image"""
+    """Generate file path for new recipe image
+
+    Only the directory and extension are kept, the storage names the
+    file after the hash of its content.
+    """
     ext = filename.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{ext}'
 
-    return os.path.join('uploads/recipe/', filename)
+    return os.path.join('uploads/recipe/', f'image.{ext}')
+
+
+def _linked_names(field_name):
+    """Return a subquery joining the names linked to the outer recipe"""
+    field = Recipe._meta.get_field(field_name)
+    obj_col = field.m2m_reverse_field_name()
+
+    return models.Subquery(
+        field.remote_field.through.objects.filter(
+            **{field.m2m_field_name(): models.OuterRef('pk')}
+        ).values(field.m2m_field_name()).annotate(
+            names=StringAgg(f'{obj_col}__name', ' ')
+        ).values('names')
+    )
+
+
+def recipe_search_vector():
+    """Return an expression computing the search vector of a recipe
+
+    Titles weigh most, then tag and ingredient names, then descriptions.
+    """
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_linked_names('tags'), weight='B',
+                       config=SEARCH_CONFIG)
+        + SearchVector(_linked_names('ingredients'), weight='B',
+                       config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
 
 
 class UserManger(BaseUserManager):
@@ -31,6 +87,7 @@ class UserManger(BaseUserManager):
         user = self.model(email=self.normalize_email(email), **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
+        UserStats.objects.using(self._db).create(user=user)
 
         return user
 
@@ -43,6 +100,549 @@ class UserManger(BaseUserManager):
 
         return user
 
+    def bump_revision(self, user):
+        """Mark the user's recipes, tags or ingredients as changed"""
+        self.filter(pk=user.pk).update(revision=models.F('revision') + 1)
+
+
+class RecipeAttrManager(models.Manager):
+    """Manager for user owned recipe attributes"""
+
+    def get_or_create_by_names(self, user, names):
+        """Return a dict of the user's objects by name, creating missing"""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+
+        objs = {obj.name: obj for obj in self.filter(user=user,
+                                                     name__in=names)}
+        missing = [name for name in names if name not in objs]
+        if missing:
+            # Rows inserted concurrently by another request are skipped by
+            # the unique constraint and picked up by the second select.
+            self.bulk_create(
+                [self.model(user=user, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            objs.update(
+                (obj.name, obj)
+                for obj in self.filter(user=user, name__in=missing)
+            )
+
+        return objs
+
+    def _recipe_links(self):
+        """Return the through model and column linking objects to recipes"""
+        rel = self.model._meta.get_field('recipe')
+        return rel.through, rel.field.m2m_reverse_name()
+
+    def add_usage(self, counts):
+        """Add deltas, by object id, to the objects' usage counts"""
+        ids_by_delta = defaultdict(list)
+        for obj_id, delta in counts.items():
+            if delta:
+                ids_by_delta[delta].append(obj_id)
+        for delta, ids in ids_by_delta.items():
+            self.filter(pk__in=ids).update(
+                usage_count=models.F('usage_count') + delta)
+
+    def recount_usage(self, ids):
+        """Recount the recipes linked to each of the objects"""
+        through, obj_col = self._recipe_links()
+        self.filter(pk__in=ids).update(usage_count=Coalesce(
+            models.Subquery(
+                through.objects.filter(
+                    **{obj_col: models.OuterRef('pk')}
+                ).values(obj_col).annotate(
+                    count=models.Count('*')
+                ).values('count')
+            ),
+            0,
+        ))
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def lock(self):
+        """Lock the rows of the recipes and return a plain queryset of them
+
+        Their stats are read after the lock is taken, so concurrent
+        writes to the same recipes are counted one after the other.
+        Rows are locked in id order, which keeps writers from waiting on
+        each other in a cycle.
+        """
+        base = self.model._base_manager
+        pks = list(base.select_for_update().filter(
+            pk__in=self.values('pk'),
+        ).order_by('pk').values_list('pk', flat=True))
+
+        return base.filter(pk__in=pks)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic():
+            objs = super().bulk_create(objs, *args, **kwargs)
+            UserStats.objects.add_recipes(objs)
+            return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        with transaction.atomic():
+            stored = {}
+            if set(STATS_FIELDS).intersection(fields):
+                stored = self.model._base_manager.select_for_update().filter(
+                    pk__in=[obj.pk for obj in objs],
+                ).only(*STATS_FIELDS).order_by('pk').in_bulk()
+            changes = [(obj.user_id, obj.stats_changes(fields,
+                                                       stored.get(obj.pk)))
+                       for obj in objs]
+            # A plain queryset keeps update() from counting them again.
+            rows = models.QuerySet(self.model, using=self.db).bulk_update(
+                objs, fields, *args, **kwargs)
+            for user_id, totals in changes:
+                UserStats.objects.add(user_id, **totals)
+            return rows
+
+    def update(self, **kwargs):
+        if not set(STATS_FIELDS).intersection(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic():
+            recipes = self.lock()
+            UserStats.objects.add_queryset(recipes, sign=-1)
+            rows = recipes.update(**kwargs)
+            UserStats.objects.add_queryset(recipes)
+            return rows
+
+    def delete(self):
+        with transaction.atomic():
+            recipes = self.lock()
+            self.model.objects.release_links(
+                list(recipes.values_list('pk', flat=True)))
+            UserStats.objects.add_queryset(recipes, sign=-1)
+            return super().delete()
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    """Manager for recipes"""
+
+    def _links(self, field_name):
+        """Return the through model and columns of a recipe M2M field"""
+        field = self.model._meta.get_field(field_name)
+        return (field.remote_field.through,
+                field.m2m_column_name(),
+                field.m2m_reverse_name())
+
+    def _objects(self, field_name):
+        """Return the manager of the objects of a recipe M2M field"""
+        return self.model._meta.get_field(field_name).related_model.objects
+
+    def links_changed(self, field_name, recipe_ids):
+        """Update what is derived from the links of the given recipes"""
+        if not recipe_ids:
+            return
+        if field_name == 'ingredients':
+            PantryEntry.objects.refresh(recipe_ids)
+        RecipeSimilarity.objects.mark_stale(recipe_ids, linked=True)
+
+    def count_links(self, field_name, links):
+        """Count new (recipe id, object id) pairs in the objects' usage"""
+        self._objects(field_name).add_usage(
+            Counter(obj_id for _, obj_id in links))
+        self.links_changed(field_name, {recipe_id for recipe_id, _ in links})
+
+    def add_links(self, field_name, links):
+        """Insert new (recipe id, object id) pairs with a single query
+
+        Pairs already linked, such as those inserted meanwhile by another
+        transaction, are skipped and left out of the usage counts.
+        """
+        through, recipe_col, obj_col = self._links(field_name)
+        links = list(links)
+        if not links:
+            return
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {through._meta.db_table} '
+                f'({recipe_col}, {obj_col}) '
+                f'SELECT * FROM unnest(%s::bigint[], %s::bigint[]) '
+                f'ON CONFLICT DO NOTHING RETURNING {recipe_col}, {obj_col}',
+                [[recipe_id for recipe_id, _ in links],
+                 [obj_id for _, obj_id in links]],
+            )
+            inserted = cursor.fetchall()
+        self.count_links(field_name, inserted)
+
+    def set_links(self, field_name, wanted):
+        """Link each recipe to exactly the wanted object ids
+
+        `wanted` maps recipe ids to sets of object ids. The recipes are
+        locked before their current links are loaded in one query, so
+        concurrent writes to the same recipes apply one after the other.
+        Only the links that differ are deleted or inserted. Returns the
+        ids of the recipes whose links changed.
+        """
+        through, recipe_col, obj_col = self._links(field_name)
+        with transaction.atomic():
+            self.filter(pk__in=list(wanted)).lock()
+            current = defaultdict(set)
+            rows = through.objects.filter(
+                **{f'{recipe_col}__in': list(wanted)}
+            ).values_list(recipe_col, obj_col)
+            for recipe_id, obj_id in rows:
+                current[recipe_id].add(obj_id)
+
+            stale = []
+            shrunk = set()
+            removed = Counter()
+            added = []
+            for recipe_id, ids in wanted.items():
+                obj_ids = current[recipe_id] - set(ids)
+                if obj_ids:
+                    stale.append(models.Q(**{recipe_col: recipe_id,
+                                             f'{obj_col}__in': obj_ids}))
+                    removed.update(obj_ids)
+                    shrunk.add(recipe_id)
+                added.extend(
+                    (recipe_id, obj_id)
+                    for obj_id in set(ids) - current[recipe_id]
+                )
+            if stale:
+                through.objects.filter(reduce(or_, stale)).delete()
+                self._objects(field_name).add_usage(
+                    {obj_id: -count for obj_id, count in removed.items()})
+                # Recipes gaining links are updated by add_links.
+                self.links_changed(field_name, shrunk - {
+                    recipe_id for recipe_id, _ in added})
+            self.add_links(field_name, added)
+
+        return {
+            recipe_id for recipe_id, ids in wanted.items()
+            if set(ids) != current[recipe_id]
+        }
+
+    def release_links(self, recipe_ids):
+        """Uncount the links of recipes about to be deleted"""
+        RecipeSimilarity.objects.mark_stale(recipe_ids)
+        for field_name in ('tags', 'ingredients'):
+            through, recipe_col, obj_col = self._links(field_name)
+            rows = through.objects.filter(
+                **{f'{recipe_col}__in': recipe_ids}
+            ).values(obj_col).annotate(
+                count=models.Count('*')
+            ).values_list(obj_col, 'count')
+            self._objects(field_name).add_usage(
+                {obj_id: -count for obj_id, count in rows})
+
+    def update_search_vectors(self, recipe_ids):
+        """Recompute the search vectors of recipes after any write"""
+        self.filter(pk__in=recipe_ids).update(
+            search_vector=recipe_search_vector())
+
+
+class ImageBlobManager(models.Manager):
+    """Manager for reference counts of stored image files"""
+
+    def lock(self, names):
+        """Lock the rows of the given files until the transaction ends
+
+        Missing rows are created without references. Files are only
+        checked, written or deleted by storage under this lock, so a
+        file found stored is kept until the transaction acquiring it
+        commits.
+        """
+        names = {name for name in names if name}
+        while names:
+            self.bulk_create([self.model(name=name) for name in names],
+                             ignore_conflicts=True)
+            # Rows deleted while waiting for their lock are created again.
+            names -= set(self.select_for_update().filter(
+                name__in=names).values_list('name', flat=True))
+
+    def acquire(self, names):
+        """Count one more reference to each of the stored files"""
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+
+        self.bulk_create([self.model(name=name) for name in counts],
+                         ignore_conflicts=True)
+        for name, count in counts.items():
+            self.filter(name=name).update(
+                references=models.F('references') + count)
+
+    def release(self, names):
+        """Drop a reference to each file, deleting unreferenced files
+
+        Files are deleted once the transaction commits, unless they were
+        acquired again meanwhile. Files without a count, such as those
+        stored before counting started, are left to the gc_images
+        command.
+        """
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+
+        with transaction.atomic():
+            orphans = []
+            for blob in self.select_for_update().filter(name__in=counts):
+                blob.references = max(blob.references - counts[blob.name], 0)
+                blob.save(update_fields=['references'])
+                if not blob.references:
+                    orphans.append(blob.name)
+
+            def delete_orphans():
+                with transaction.atomic():
+                    self.lock(orphans)
+                    unused = list(self.filter(
+                        name__in=orphans, references=0,
+                    ).values_list('name', flat=True))
+                    for name in unused:
+                        default_storage.delete(name)
+                    self.filter(name__in=unused).delete()
+
+            transaction.on_commit(delete_orphans)
+
+
+class PantryEntryManager(models.Manager):
+    """Manager for the sparse recipe by ingredient matrix"""
+
+    def refresh(self, recipe_ids):
+        """Rewrite the entries of recipes whose ingredients changed
+
+        `recipe_ids` may be a queryset of ids, and the entries are copied
+        from the links with a single INSERT ... SELECT. The recipes are
+        locked first, so concurrent refreshes of a recipe run in turn.
+        """
+        with transaction.atomic():
+            Recipe.objects.filter(pk__in=recipe_ids).lock()
+            self.filter(recipe__in=recipe_ids).delete()
+            through = Recipe.ingredients.through
+            rows = through.objects.filter(recipe__in=recipe_ids).annotate(
+                count=models.Window(models.Count('*'),
+                                    partition_by=[models.F('recipe_id')]),
+            ).values_list('ingredient_id', 'recipe_id', 'count')
+            try:
+                sql, params = rows.query.sql_with_params()
+            except EmptyResultSet:
+                return
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.model._meta.db_table} '
+                    f'(ingredient_id, recipe_id, ingredient_count) {sql}',
+                    params,
+                )
+
+    def match(self, ingredient_ids):
+        """Rank the recipes using the ingredients by the share they use
+
+        Rows hold the recipe id, its number of the given ingredients and
+        its number of ingredients, best covered recipes first and those
+        using more of the ingredients first among equals.
+        """
+        return self.filter(ingredient__in=ingredient_ids).values(
+            'recipe_id',
+        ).annotate(
+            matched=models.Count('*'),
+            total=models.Min('ingredient_count'),
+        ).annotate(coverage=models.ExpressionWrapper(
+            Cast('matched', models.FloatField()) / models.F('total'),
+            output_field=models.FloatField(),
+        )).order_by('-coverage', '-matched', '-recipe_id')
+
+
+class RecipeSimilarityManager(models.Manager):
+    """Manager for the precomputed lists of similar recipes"""
+
+    def _links(self):
+        """Return the through models and columns of recipe links"""
+        return [Recipe.objects._links(field_name)
+                for field_name in ('tags', 'ingredients')]
+
+    def _link_counts(self, recipe_ids):
+        """Count the tags and ingredients of each recipe"""
+        counts = Counter()
+        for through, recipe_col, _ in self._links():
+            counts.update(dict(through.objects.filter(
+                **{f'{recipe_col}__in': recipe_ids},
+            ).values(recipe_col).annotate(
+                count=models.Count('*'),
+            ).values_list(recipe_col, 'count')))
+
+        return counts
+
+    def _shared_link_counts(self, recipe):
+        """Count the tags and ingredients other recipes share with one"""
+        counts = Counter()
+        for through, recipe_col, obj_col in self._links():
+            counts.update(dict(through.objects.filter(**{
+                f'{obj_col}__in': through.objects.filter(
+                    **{recipe_col: recipe.pk}).values(obj_col),
+            }).exclude(**{recipe_col: recipe.pk}).values(recipe_col).annotate(
+                count=models.Count('*'),
+            ).values_list(recipe_col, 'count')))
+
+        return counts
+
+    def build(self, recipe):
+        """Compute and store the recipes most similar to a recipe
+
+        Recipes are ranked by the Jaccard index of their tags and
+        ingredients, counted from the links of the recipe's own tags and
+        ingredients. The index is at most the share of those a candidate
+        has, so once enough recipes are kept, candidates sharing fewer
+        can't rank and their sizes are never loaded. The list is locked
+        while it is built, so links changed meanwhile mark it stale again
+        once it is stored.
+        """
+        with transaction.atomic():
+            self.queue([recipe.pk])
+            similarity = self.select_for_update().get(recipe=recipe)
+            size = self._link_counts([recipe.pk])[recipe.pk]
+            by_shared = defaultdict(list)
+            for recipe_id, shared in self._shared_link_counts(
+                    recipe).items():
+                by_shared[shared].append(recipe_id)
+
+            kept = []
+            for shared in sorted(by_shared, reverse=True):
+                if (len(kept) == SIMILAR_RECIPES_KEPT
+                        and kept[0][0] >= shared / size):
+                    break
+                sizes = self._link_counts(by_shared[shared])
+                for recipe_id in by_shared[shared]:
+                    score = shared / (size + sizes[recipe_id] - shared)
+                    if len(kept) < SIMILAR_RECIPES_KEPT:
+                        heapq.heappush(kept, (score, recipe_id))
+                    else:
+                        heapq.heappushpop(kept, (score, recipe_id))
+            kept.sort(reverse=True)
+
+            similarity.similar_ids = [recipe_id for _, recipe_id in kept]
+            similarity.scores = [score for score, _ in kept]
+            similarity.stale = False
+            similarity.save()
+
+        return similarity
+
+    def build_next(self):
+        """Rebuild the next stale list, returning False when none is left
+
+        The list stays locked while it is built and is skipped by other
+        workers. Links changed meanwhile wait for the lock, then mark the
+        list stale again.
+        """
+        with transaction.atomic():
+            similarity = self.select_for_update(
+                skip_locked=True,
+                of=('self',),
+            ).filter(stale=True).select_related('recipe').order_by(
+                'recipe_id').first()
+            if similarity is None:
+                return False
+
+            self.build(similarity.recipe)
+
+        return True
+
+    def queue(self, recipe_ids):
+        """Store empty stale lists for the recipes missing one"""
+        self.bulk_create([
+            self.model(recipe_id=recipe_id, similar_ids=[], scores=[],
+                       stale=True)
+            for recipe_id in recipe_ids
+        ], ignore_conflicts=True)
+
+    def for_recipe(self, recipe):
+        """Return the list of a recipe, queueing it when missing
+
+        Stale lists are served until they are rebuilt.
+        """
+        similarity = self.filter(recipe=recipe).first()
+        if similarity is None:
+            self.queue([recipe.pk])
+            similarity = self.model(recipe=recipe, similar_ids=[],
+                                    scores=[], stale=True)
+
+        return similarity
+
+    def mark_stale(self, recipe_ids, linked=False):
+        """Mark the lists recipes changing links or deleted may change
+
+        Lists showing those recipes are marked. With `linked`, so are the
+        lists of the recipes themselves, queued when missing, and of every
+        recipe sharing a tag or ingredient with them, which the recipes
+        may now enter. Lists being built are marked once built, so links
+        changed meanwhile are never missed.
+        """
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+
+        stale = models.Q(similar_ids__overlap=recipe_ids)
+        if linked:
+            stale |= models.Q(recipe__in=recipe_ids)
+            for through, recipe_col, obj_col in self._links():
+                stale |= models.Q(recipe__in=through.objects.filter(**{
+                    f'{obj_col}__in': through.objects.filter(
+                        **{f'{recipe_col}__in': recipe_ids}).values(obj_col),
+                }).values(recipe_col))
+        self.filter(stale).update(stale=True)
+        if linked:
+            self.queue(recipe_ids)
+
+
+class UserStatsManager(models.Manager):
+    """Manager for the counters of each user's recipes"""
+
+    def add(self, user_id, recipes=0, **totals):
+        """Add to a user's recipe count and to the totals of STATS_FIELDS"""
+        values = {
+            f'total_{field}': models.F(f'total_{field}') + value
+            for field, value in totals.items() if value
+        }
+        if recipes:
+            values['recipe_count'] = models.F('recipe_count') + recipes
+        if not values:
+            return
+
+        if not self.filter(user_id=user_id).update(**values):
+            self.bulk_create([self.model(user_id=user_id)],
+                             ignore_conflicts=True)
+            self.filter(user_id=user_id).update(**values)
+
+    def add_recipes(self, recipes):
+        """Count new recipes in the stats of their users"""
+        by_user = defaultdict(Counter)
+        for recipe in recipes:
+            by_user[recipe.user_id].update(recipes=1, **recipe.stats_values())
+        for user_id, totals in by_user.items():
+            self.add(user_id, **totals)
+
+    def add_queryset(self, recipes, sign=1):
+        """Count recipes in, or with a sign of -1 out of, users' stats
+
+        The recipes are summed by user in the database.
+        """
+        rows = recipes.order_by().values('user_id').annotate(
+            recipe_count=models.Count('*'),
+            **{f'total_{field}': models.Sum(field) for field in STATS_FIELDS},
+        )
+        for row in rows:
+            self.add(row['user_id'], recipes=sign * row['recipe_count'], **{
+                field: sign * row[f'total_{field}'] for field in STATS_FIELDS
+            })
+
+    def rebuild(self, users):
+        """Recompute the stats of the users from their recipes"""
+        user_ids = list(users.values_list('pk', flat=True))
+        rows = Recipe.objects.filter(user__in=user_ids).values(
+            'user_id',
+        ).annotate(
+            recipe_count=models.Count('*'),
+            **{f'total_{field}': models.Sum(field) for field in STATS_FIELDS},
+        ).order_by()
+        self.filter(user__in=user_ids).delete()
+        self.bulk_create([self.model(**row) for row in rows])
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     """User in the system"""
@@ -50,15 +650,47 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped on every change to the user's library, to version list views.
+    revision = models.PositiveBigIntegerField(default=0)
 
     objects = UserManger()
 
     USERNAME_FIELD = 'email'
 
 
+class UserStats(models.Model):
+    """Counters of a user's recipes, kept by the recipe write paths"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='stats')
+    recipe_count = models.PositiveIntegerField(default=0)
+    total_time_minutes = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2,
+                                      default=0)
+
+    objects = UserStatsManager()
+
+    def __str__(self):
+        return str(self.user_id)
+
+    @property
+    def average_time_minutes(self):
+        if not self.recipe_count:
+            return None
+        return self.total_time_minutes / self.recipe_count
+
+    @property
+    def average_price(self):
+        if not self.recipe_count:
+            return None
+        return self.total_price / self.recipe_count
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_index=False)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     time_minutes = models.IntegerField()
@@ -67,15 +699,128 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Storage names of the resized copies of `image`, by rendition.
+    image_renditions = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Kept in sync by RecipeManager.update_search_vectors.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'],
+                         name='recipe_user_id_desc_idx'),
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='recipe_user_time_idx'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='recipe_user_price_idx'),
+            models.Index(fields=['user', 'title', 'id'],
+                         name='recipe_user_title_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='recipe_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def stats_values(self, fields=STATS_FIELDS):
+        """Return the values of STATS_FIELDS, as stored"""
+        return {
+            field: self._meta.get_field(field).to_python(getattr(self, field))
+            for field in fields
+        }
+
+    def stats_changes(self, fields=STATS_FIELDS, stored=None):
+        """Return the changes to STATS_FIELDS a save of fields will make
+
+        Values are compared to the stored row, which is locked and read
+        unless given, so the caller must be in a transaction.
+        """
+        fields = [field for field in STATS_FIELDS if field in fields]
+        if not fields:
+            return {}
+        if stored is None and not self._state.adding:
+            stored = Recipe._base_manager.select_for_update().filter(
+                pk=self.pk).only(*fields).first()
+
+        return {
+            field: value - (getattr(stored, field) if stored else 0)
+            for field, value in self.stats_values(fields).items()
+        }
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            changes = self.stats_changes(
+                kwargs.get('update_fields') or STATS_FIELDS)
+            super().save(*args, **kwargs)
+            UserStats.objects.add(self.user_id, recipes=int(adding),
+                                  **changes)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            recipes = Recipe.objects.filter(pk=self.pk).lock()
+            Recipe.objects.release_links([self.pk])
+            UserStats.objects.add_queryset(recipes, sign=-1)
+            return super().delete(*args, **kwargs)
+
+    @property
+    def image_names(self):
+        """Return the storage names of the image and its renditions"""
+        names = list(self.image_renditions.values())
+        if self.image:
+            names.append(self.image.name)
+
+        return names
+
+
+class ImageBlob(models.Model):
+    """A stored image file and the number of references to it"""
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeImageJob(models.Model):
+    """Pending generation of the renditions of a recipe image"""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    image = models.CharField(max_length=255)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.image
+
 
 class Tag(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_index=False)
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Number of recipes linked, kept by RecipeManager and core.signals.
+    usage_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='unique_tag_name_per_user'),
+        ]
+        indexes = [
+            GinIndex(name_words(), name='tag_name_words_idx'),
+            GinIndex(fields=['name'], name='tag_name_trgm_idx',
+                     opclasses=['gin_trgm_ops']),
+            models.Index(fields=['user', '-usage_count'],
+                         name='tag_user_usage_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -83,8 +828,78 @@ class Tag(models.Model):
 
 class Ingredient(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_index=False)
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Number of recipes linked, kept by RecipeManager and core.signals.
+    usage_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='unique_ingredient_name_per_user'),
+        ]
+        indexes = [
+            GinIndex(name_words(), name='ingredient_name_words_idx'),
+            GinIndex(fields=['name'], name='ingredient_name_trgm_idx',
+                     opclasses=['gin_trgm_ops']),
+            models.Index(fields=['user', '-usage_count'],
+                         name='ingredient_user_usage_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class PantryEntry(models.Model):
+    """An ingredient of a recipe, with the recipe's ingredient count
+
+    This is the recipe by ingredient matrix of Recipe.ingredients, kept by
+    RecipeManager and core.signals. Carrying the count lets the coverage
+    of a pantry be summed from the index alone, without visiting recipes.
+    """
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   db_index=False)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    ingredient_count = models.PositiveSmallIntegerField()
+
+    objects = PantryEntryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ingredient', 'recipe'],
+                                    include=['ingredient_count'],
+                                    name='unique_pantry_entry'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.ingredient_id}'
+
+
+class RecipeSimilarity(models.Model):
+    """The recipes most similar to a recipe, best first, with their scores
+
+    Built by the build_similar_recipes command, and marked stale by
+    RecipeManager when the links it was computed from change. Stale
+    lists are served until the command builds them again.
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True)
+    similar_ids = ArrayField(models.BigIntegerField())
+    scores = ArrayField(models.FloatField())
+    stale = models.BooleanField(default=False)
+
+    objects = RecipeSimilarityManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['similar_ids'], name='recipe_similar_ids_idx'),
+            models.Index(fields=['recipe'], condition=models.Q(stale=True),
+                         name='recipe_similar_stale_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.recipe_id)
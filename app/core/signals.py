@@ -0,0 +1,70 @@
+"""
+Signal handlers keeping image reference counts, usage counts and what
+is derived from recipe links in sync.
+"""
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import ImageBlob, Ingredient, Recipe, Tag
+
+# Recipe M2M field of each through model and linked model.
+FIELD_NAMES = {
+    Recipe.tags.through: 'tags',
+    Recipe.ingredients.through: 'ingredients',
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_images(sender, instance, **kwargs):
+    """Deleted recipes no longer reference their image and renditions"""
+    ImageBlob.objects.release(instance.image_names)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def links_changed(sender, instance, action, reverse, model, pk_set,
+                  **kwargs):
+    """Recount usage after links are changed through related managers
+
+    What else is derived from the links is updated by RecipeManager.
+    Links written by RecipeManager don't send this signal and keep
+    everything in sync themselves.
+    """
+    if action == 'pre_clear':
+        # The cleared ids are only known before the links are deleted.
+        if reverse:
+            lookup, col = type(instance)._meta.model_name, 'recipe_id'
+        else:
+            lookup, col = 'recipe', f'{model._meta.model_name}_id'
+        instance._cleared_ids = list(sender.objects.filter(
+            **{lookup: instance}).values_list(col, flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_ids')
+    elif action not in ('post_add', 'post_remove'):
+        return
+
+    if reverse:
+        type(instance).objects.recount_usage([instance.pk])
+        recipe_ids = pk_set
+    else:
+        model.objects.recount_usage(pk_set)
+        recipe_ids = [instance.pk]
+    Recipe.objects.links_changed(FIELD_NAMES[sender], recipe_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_linked_recipes(sender, instance, **kwargs):
+    instance._recipe_ids = list(instance.recipe_set.values_list(
+        'id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def linked_recipes_changed(sender, instance, **kwargs):
+    """Recipes of a deleted tag or ingredient have one link less"""
+    Recipe.objects.links_changed(FIELD_NAMES[sender],
+                                 instance.__dict__.pop('_recipe_ids', []))
@@ -0,0 +1,51 @@
+"""
+Content addressed file storage.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+from .models import ImageBlob
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files by the SHA-256 of their content
+
+    The directory and extension of the requested name are kept, the rest
+    is replaced by the hash, so saving the same content twice returns the
+    existing name without writing anything. The file's ImageBlob row is
+    locked first, so save within the transaction acquiring the file for
+    it to be kept.
+    """
+
+    def _content_hash(self, content):
+        # Uploads streamed through the image handler are already hashed.
+        digest = getattr(content, 'content_hash', None)
+        if digest:
+            return digest
+
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+
+        return sha.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = self._content_hash(content)
+        _, ext = os.path.splitext(name)
+        name = os.path.join(os.path.dirname(name), digest[:2],
+                            f'{digest}{ext.lower()}')
+        with transaction.atomic():
+            ImageBlob.objects.lock([name])
+            if self.exists(name):
+                return name
+
+            return super().save(name, content, max_length)
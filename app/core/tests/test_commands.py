@@ -2,12 +2,25 @@
 Test custom Django management commands.
 """
 from unittest.mock import patch, MagicMock
+from io import StringIO
+import json
+import os
+import tempfile
+import threading
+import time
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from core.models import ImageBlob, Recipe, RecipeSimilarity, Tag, UserStats
 
 
 class CommandTests(TestCase):
@@ -63,3 +76,254 @@ class CommandTests(TestCase):
         self.assertEqual(mock_connection.cursor.call_count, 6)
         # Verify sleep was called 5 times (for each failure)
         self.assertEqual(patched_sleep.call_count, 5)
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'recipes.ndjson')
+        with open(self.path, 'w') as f:
+            for i in range(5):
+                f.write(json.dumps({
+                    'title': f'Recipe {i}',
+                    'time_minutes': 10,
+                    'price': '1.00',
+                    'tags': ['Dinner'],
+                }) + '\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_import_recipes(self):
+        """Test importing a file in batches reports progress."""
+        out = StringIO()
+        call_command('import_recipes', self.path, user=self.user.email,
+                     batch_size=2, stdout=out)
+
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(self.user.tag_set.count(), 1)
+        self.assertEqual(out.getvalue().count('rows/s'), 3)
+
+    def test_import_recipes_resumes_from_checkpoint(self):
+        """Test rows before the checkpoint are skipped."""
+        checkpoint = os.path.join(self.tmp_dir.name, 'import.checkpoint')
+        with open(checkpoint, 'w') as f:
+            f.write('3')
+
+        call_command('import_recipes', self.path, user=self.user.email,
+                     checkpoint=checkpoint, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Recipe 3', 'Recipe 4'],
+        )
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_import_recipes_unknown_user(self):
+        """Test importing for a missing user fails."""
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', self.path,
+                         user='missing@example.com')
+
+
+class BenchmarkRecipesCommandTests(TestCase):
+    """Test the benchmark_recipes command."""
+
+    def test_benchmark_recipes(self):
+        """Test seeding a small dataset and timing the scenarios."""
+        out = StringIO()
+        call_command('benchmark_recipes', recipes=20, users=2, runs=2,
+                     stdout=out)
+
+        self.assertEqual(Recipe.objects.count(), 20)
+        recipe = Recipe.objects.first()
+        self.assertEqual(recipe.tags.count(), 3)
+        self.assertEqual(recipe.ingredients.count(), 8)
+        self.assertIn('recipe list', out.getvalue())
+        self.assertIn('median', out.getvalue())
+
+
+class BuildSimilarRecipesCommandTests(TestCase):
+    """Test the build_similar_recipes command."""
+
+    def setUp(self):
+        call_command('benchmark_recipes', recipes=20, users=2, runs=1,
+                     stdout=StringIO())
+        # The benchmark builds a list when timing similar recipes.
+        RecipeSimilarity.objects.all().delete()
+
+    def test_build_similar_recipes(self):
+        """Test lists are built for recipes missing them only."""
+        out = StringIO()
+        call_command('build_similar_recipes', stdout=out)
+
+        self.assertIn('Built 20 similar recipe lists', out.getvalue())
+        self.assertEqual(RecipeSimilarity.objects.count(), 20)
+        call_command('build_similar_recipes', stdout=out)
+        self.assertIn('Built 0 similar recipe lists', out.getvalue())
+
+    def test_build_similar_recipes_of_user(self):
+        """Test --user and --rebuild limit and widen the recipes built."""
+        out = StringIO()
+        call_command('build_similar_recipes', '--rebuild',
+                     user='benchmark-1@example.com', stdout=out)
+        call_command('build_similar_recipes', '--rebuild',
+                     user='benchmark-1@example.com', stdout=out)
+
+        self.assertEqual(out.getvalue().count('Built 10 similar'), 2)
+        self.assertEqual(RecipeSimilarity.objects.count(), 10)
+
+
+class RebuildStatsCommandTests(TestCase):
+    """Test the rebuild_stats command."""
+
+    def test_rebuild_stats(self):
+        """Test stats and usage counts are recomputed."""
+        call_command('benchmark_recipes', recipes=20, users=2, runs=1,
+                     stdout=StringIO())
+        UserStats.objects.all().delete()
+        Tag.objects.update(usage_count=0)
+        out = StringIO()
+
+        call_command('rebuild_stats', user='benchmark-0@example.com',
+                     stdout=out)
+
+        self.assertIn('Rebuilt the stats of 1 users', out.getvalue())
+        stats = UserStats.objects.get()
+        self.assertEqual(stats.recipe_count, 10)
+        self.assertEqual(stats.user.email, 'benchmark-0@example.com')
+        tag = Tag.objects.filter(user=stats.user).first()
+        self.assertEqual(tag.usage_count, tag.recipe_set.count())
+
+    def test_rebuild_stats_unknown_user(self):
+        """Test an unknown user is reported."""
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', user='nobody@example.com')
+
+
+class ProcessImageJobsCommandTests(TestCase):
+    """Test the image job worker command."""
+
+    @patch('core.management.commands.process_image_jobs.process_next_job')
+    def test_process_image_jobs_once(self, patched_process):
+        """Test pending jobs are processed until none is left."""
+        patched_process.side_effect = [True, True, False]
+        out = StringIO()
+
+        call_command('process_image_jobs', '--once', stdout=out)
+
+        self.assertEqual(patched_process.call_count, 3)
+        self.assertIn('Processed 2 image jobs', out.getvalue())
+
+
+class GcImagesCommandTests(TestCase):
+    """Test sweeping unreferenced image files."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        user = get_user_model().objects.create_user('user@example.com',
+                                                    'password123')
+        self.image = default_storage.save('uploads/recipe/image.jpg',
+                                          ContentFile(b'image'))
+        self.rendition = default_storage.save('uploads/recipe/image.jpg',
+                                              ContentFile(b'rendition'))
+        self.orphan = default_storage.save('uploads/recipe/image.jpg',
+                                           ContentFile(b'orphan'))
+        Recipe.objects.create(
+            user=user, title='Sample', time_minutes=5, price='5.00',
+            image=self.image,
+            image_renditions={'thumbnail': self.rendition},
+        )
+        ImageBlob.objects.acquire([self.image, self.orphan])
+        # The rendition was stored before references were counted.
+        ImageBlob.objects.filter(name=self.rendition).delete()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def test_gc_images(self):
+        """Test unreferenced files and counts are deleted."""
+        out = StringIO()
+
+        call_command('gc_images', '--grace', '0', stdout=out)
+
+        self.assertTrue(default_storage.exists(self.image))
+        self.assertTrue(default_storage.exists(self.rendition))
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertEqual(
+            list(ImageBlob.objects.values_list('name', flat=True)),
+            [self.image],
+        )
+        self.assertIn('Deleted 1 image files (6 bytes)', out.getvalue())
+
+    def test_gc_images_keeps_recent_files(self):
+        """Test files within the grace period are kept."""
+        call_command('gc_images', stdout=StringIO())
+
+        self.assertTrue(default_storage.exists(self.orphan))
+
+    def test_gc_images_dry_run(self):
+        """Test a dry run deletes nothing."""
+        out = StringIO()
+
+        call_command('gc_images', '--grace', '0', '--dry-run', stdout=out)
+
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.assertEqual(ImageBlob.objects.count(), 2)
+        self.assertIn('Would delete 1 image files', out.getvalue())
+
+
+class GcImagesRaceTests(TransactionTestCase):
+    """Test sweeping image files while they are being uploaded."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.user = get_user_model().objects.create_user('user@example.com',
+                                                         'password123')
+        self.orphan = default_storage.save('uploads/recipe/image.jpg',
+                                           ContentFile(b'orphan'))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def test_gc_images_keeps_file_being_reused(self):
+        """Test an old file stored again by an upload is kept."""
+        stored = threading.Event()
+
+        def upload():
+            try:
+                with transaction.atomic():
+                    name = default_storage.save('uploads/recipe/image.jpg',
+                                                ContentFile(b'orphan'))
+                    stored.set()
+                    time.sleep(0.5)
+                    Recipe.objects.create(
+                        user=self.user, title='Sample', time_minutes=5,
+                        price='5.00', image=name,
+                    )
+                    ImageBlob.objects.acquire([name])
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=upload)
+        thread.start()
+        stored.wait(timeout=5)
+        call_command('gc_images', '--grace', '0', stdout=StringIO())
+        thread.join()
+
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.assertEqual(ImageBlob.objects.get(name=self.orphan).references,
+                         1)
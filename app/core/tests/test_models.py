@@ -1,11 +1,17 @@
 """
 Test for Models.
 """
-from unittest.mock import patch
 from decimal import Decimal
-from django.test import TestCase
+import tempfile
+import threading
+import time
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from core import models
+from core.storage import ContentAddressedStorage
 
 
 def create_user(email='test@example', password='testpass123', **params):
@@ -88,12 +94,539 @@ class ModelTests(TestCase):
 
         self.assertEqual(ingredient.user, user)
 
-    @patch('core.models.uuid.uuid4')
-    def test_recipe_file_name_uuid(self, mock_uuid):
+    def test_get_or_create_by_names(self):
+        """Test existing attributes are reused and missing ones created"""
+        user = create_user()
+        other_user = create_user(email='other@example')
+        existing = models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(user=other_user, name='Dinner')
+
+        tags = models.Tag.objects.get_or_create_by_names(
+            user,
+            ['Vegan', 'Dinner', 'Vegan'],
+        )
+
+        self.assertEqual(set(tags), {'Vegan', 'Dinner'})
+        self.assertEqual(tags['Vegan'], existing)
+        self.assertEqual(tags['Dinner'].user, user)
+        self.assertEqual(models.Tag.objects.filter(user=user).count(), 2)
+
+    def test_attribute_name_unique_per_user(self):
+        """Test a user can't have two ingredients with the same name"""
+        user = create_user()
+        models.Ingredient.objects.create(user=user, name='Salt')
+        models.Ingredient.objects.create(
+            user=create_user(email='other@example'),
+            name='Salt',
+        )
+
+        with self.assertRaises(IntegrityError):
+            models.Ingredient.objects.create(user=user, name='Salt')
+
+    def test_recipe_file_name(self):
         """testing genrating image path"""
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
-        exp_path = f'uploads/recipe/{uuid}.jpg'
+        exp_path = 'uploads/recipe/image.jpg'
         self.assertEqual(file_path, exp_path)
+
+
+class ImageStorageTests(TestCase):
+    """Test content addressed image storage and reference counts"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.storage = ContentAddressedStorage(location=self.media.name)
+
+    def tearDown(self):
+        self.media.cleanup()
+
+    def test_same_content_stored_once(self):
+        """Test saving identical content twice returns the same name"""
+        first = self.storage.save('uploads/recipe/a.JPG',
+                                  ContentFile(b'content'))
+        second = self.storage.save('uploads/recipe/b.jpg',
+                                   ContentFile(b'content'))
+        other = self.storage.save('uploads/recipe/c.jpg',
+                                  ContentFile(b'other'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith('uploads/recipe/'))
+        self.assertTrue(first.endswith('.jpg'))
+        directory = first.rsplit('/', 1)[0]
+        self.assertEqual(len(self.storage.listdir(directory)[1]), 1)
+
+    def test_release_deletes_unreferenced_file(self):
+        """Test a file is deleted once its last reference is released"""
+        with override_settings(MEDIA_ROOT=self.media.name):
+            name = models.default_storage.save('uploads/recipe/a.jpg',
+                                               ContentFile(b'content'))
+            models.ImageBlob.objects.acquire([name, name])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                models.ImageBlob.objects.release([name])
+            self.assertEqual(
+                models.ImageBlob.objects.get(name=name).references, 1)
+            self.assertTrue(models.default_storage.exists(name))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                models.ImageBlob.objects.release([name])
+            self.assertFalse(
+                models.ImageBlob.objects.filter(name=name).exists())
+            self.assertFalse(models.default_storage.exists(name))
+
+    def test_release_keeps_file_stored_again(self):
+        """Test a file saved again before its deletion runs is kept"""
+        with override_settings(MEDIA_ROOT=self.media.name):
+            name = models.default_storage.save('uploads/recipe/a.jpg',
+                                               ContentFile(b'content'))
+            models.ImageBlob.objects.acquire([name])
+            with self.captureOnCommitCallbacks() as callbacks:
+                models.ImageBlob.objects.release([name])
+
+            again = models.default_storage.save('uploads/recipe/b.jpg',
+                                                ContentFile(b'content'))
+            models.ImageBlob.objects.acquire([again])
+            for callback in callbacks:
+                callback()
+
+            self.assertEqual(again, name)
+            self.assertTrue(models.default_storage.exists(name))
+            self.assertEqual(
+                models.ImageBlob.objects.get(name=name).references, 1)
+
+    def test_save_rewrites_file_deleted_meanwhile(self):
+        """Test content whose file was deleted is written again"""
+        with override_settings(MEDIA_ROOT=self.media.name):
+            name = models.default_storage.save('uploads/recipe/a.jpg',
+                                               ContentFile(b'content'))
+            models.default_storage.delete(name)
+
+            again = models.default_storage.save('uploads/recipe/a.jpg',
+                                                ContentFile(b'content'))
+
+            self.assertEqual(again, name)
+            self.assertTrue(models.default_storage.exists(name))
+
+
+class UsageCountTests(TestCase):
+    """Test tag and ingredient usage counts follow recipe links"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.tags = [models.Tag.objects.create(user=self.user, name=name)
+                     for name in ('Vegan', 'Quick')]
+        self.recipes = [
+            models.Recipe.objects.create(user=self.user, title=title,
+                                         time_minutes=5, price=Decimal('1'))
+            for title in ('Soup', 'Salad', 'Stew')
+        ]
+
+    def assertUsage(self, *counts):
+        for tag, count in zip(self.tags, counts):
+            tag.refresh_from_db()
+            self.assertEqual(tag.usage_count, count)
+
+    def test_manager_links_counted(self):
+        """Test links written by the recipe manager are counted"""
+        vegan, quick = self.tags
+        soup, salad, stew = self.recipes
+        models.Recipe.objects.add_links('tags', [
+            (soup.id, vegan.id), (salad.id, vegan.id), (stew.id, quick.id),
+        ])
+        self.assertUsage(2, 1)
+
+        models.Recipe.objects.set_links('tags', {
+            soup.id: {quick.id},
+            stew.id: {quick.id},
+        })
+        self.assertUsage(1, 2)
+
+    def test_related_manager_links_counted(self):
+        """Test links changed through related managers are counted"""
+        vegan, quick = self.tags
+        soup, salad, _ = self.recipes
+        soup.tags.add(vegan, quick)
+        vegan.recipe_set.add(salad)
+        self.assertUsage(2, 1)
+
+        soup.tags.remove(vegan)
+        self.assertUsage(1, 1)
+        soup.tags.clear()
+        self.assertUsage(1, 0)
+        vegan.recipe_set.clear()
+        self.assertUsage(0, 0)
+
+    def test_deleted_recipes_uncounted(self):
+        """Test deleting recipes, alone or in bulk, drops their links"""
+        vegan, quick = self.tags
+        for recipe in self.recipes:
+            recipe.tags.add(vegan)
+        self.recipes[0].tags.add(quick)
+
+        self.recipes[0].delete()
+        self.assertUsage(2, 0)
+        models.Recipe.objects.filter(user=self.user).delete()
+        self.assertUsage(0, 0)
+
+
+class PantryEntryTests(TestCase):
+    """Test the pantry matrix follows recipe ingredients"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.ingredients = [
+            models.Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Salt', 'Egg', 'Flour')
+        ]
+        self.recipes = [
+            models.Recipe.objects.create(user=self.user, title=title,
+                                         time_minutes=5, price=Decimal('1'))
+            for title in ('Omelette', 'Bread')
+        ]
+
+    def assertEntries(self, expected):
+        """Assert the (recipe, ingredient, ingredient count) entries"""
+        self.assertEqual(
+            set(models.PantryEntry.objects.values_list(
+                'recipe_id', 'ingredient_id', 'ingredient_count')),
+            {(recipe.id, ingredient.id, count)
+             for recipe, ingredient, count in expected},
+        )
+
+    def test_manager_links_indexed(self):
+        """Test links written by the recipe manager are indexed"""
+        salt, egg, flour = self.ingredients
+        omelette, bread = self.recipes
+        models.Recipe.objects.add_links('ingredients', [
+            (omelette.id, salt.id), (omelette.id, egg.id),
+            (bread.id, flour.id),
+        ])
+        self.assertEntries([(omelette, salt, 2), (omelette, egg, 2),
+                            (bread, flour, 1)])
+
+        models.Recipe.objects.set_links('ingredients', {
+            omelette.id: {egg.id},
+            bread.id: {salt.id, flour.id},
+        })
+        self.assertEntries([(omelette, egg, 1), (bread, salt, 2),
+                            (bread, flour, 2)])
+
+    def test_related_manager_links_indexed(self):
+        """Test links changed through related managers are indexed"""
+        salt, egg, flour = self.ingredients
+        omelette, bread = self.recipes
+        omelette.ingredients.add(salt, egg)
+        salt.recipe_set.add(bread)
+        self.assertEntries([(omelette, salt, 2), (omelette, egg, 2),
+                            (bread, salt, 1)])
+
+        omelette.ingredients.remove(egg)
+        self.assertEntries([(omelette, salt, 1), (bread, salt, 1)])
+        salt.recipe_set.clear()
+        self.assertEntries([])
+
+    def test_deleted_ingredients_and_recipes_unindexed(self):
+        """Test deletions leave the entries of the other links counted"""
+        salt, egg, flour = self.ingredients
+        omelette, bread = self.recipes
+        omelette.ingredients.add(salt, egg)
+        bread.ingredients.add(salt, flour)
+
+        salt.delete()
+        self.assertEntries([(omelette, egg, 1), (bread, flour, 1)])
+        bread.delete()
+        self.assertEntries([(omelette, egg, 1)])
+
+
+class RecipeSimilarityTests(TestCase):
+    """Test similar recipe lists follow recipe links"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.recipes = {
+            title: models.Recipe.objects.create(
+                user=self.user, title=title, time_minutes=5,
+                price=Decimal('1'))
+            for title in ('Pancakes', 'Crepes', 'Waffles', 'Salad')
+        }
+        self.ingredients = {
+            name: models.Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Egg', 'Flour', 'Milk', 'Sugar', 'Lettuce')
+        }
+        self.sweet = models.Tag.objects.create(user=self.user, name='Sweet')
+        for title, names in (('Pancakes', ['Egg', 'Flour', 'Milk']),
+                             ('Crepes', ['Egg', 'Flour', 'Milk']),
+                             ('Waffles', ['Egg', 'Flour', 'Sugar']),
+                             ('Salad', ['Lettuce'])):
+            self.recipes[title].ingredients.add(
+                *(self.ingredients[name] for name in names))
+        for title in ('Pancakes', 'Crepes', 'Waffles'):
+            self.recipes[title].tags.add(self.sweet)
+
+    def similar(self, title):
+        while models.RecipeSimilarity.objects.build_next():
+            pass
+        similarity = models.RecipeSimilarity.objects.for_recipe(
+            self.recipes[title])
+        return [(models.Recipe.objects.get(pk=recipe_id).title, score)
+                for recipe_id, score in zip(similarity.similar_ids,
+                                            similarity.scores)]
+
+    def test_ranked_by_jaccard_index(self):
+        """Test recipes are ranked by shared tags and ingredients"""
+        self.assertEqual(self.similar('Pancakes'),
+                         [('Crepes', 1.0), ('Waffles', 0.6)])
+        self.assertEqual(self.similar('Salad'), [])
+
+    def test_kept_recipes_limited(self):
+        """Test only the most similar recipes are kept"""
+        for i in range(models.SIMILAR_RECIPES_KEPT + 2):
+            recipe = models.Recipe.objects.create(
+                user=self.user, title=f'Omelette {i}', time_minutes=5,
+                price=Decimal('1'))
+            recipe.ingredients.add(self.ingredients['Egg'])
+
+        similar = self.similar('Pancakes')
+
+        self.assertEqual(len(similar), models.SIMILAR_RECIPES_KEPT)
+        self.assertEqual(similar[:2], [('Crepes', 1.0), ('Waffles', 0.6)])
+
+    def test_large_recipe_ids_kept(self):
+        """Test recipe ids past the 32-bit range are stored and matched"""
+        omelette = models.Recipe.objects.create(
+            id=2 ** 31 + 1, user=self.user, title='Omelette', time_minutes=5,
+            price=Decimal('1'))
+        omelette.ingredients.add(self.ingredients['Egg'])
+        self.recipes['Omelette'] = omelette
+
+        self.assertEqual(self.similar('Pancakes')[-1], ('Omelette', 0.25))
+
+        omelette.delete()
+        self.assertTrue(models.RecipeSimilarity.objects.get(
+            recipe=self.recipes['Pancakes']).stale)
+
+    def stale(self):
+        return set(models.RecipeSimilarity.objects.filter(
+            stale=True).values_list('recipe__title', flat=True))
+
+    def test_changed_links_mark_lists_stale(self):
+        """Test lists a recipe with new links may now be in are stale"""
+        self.similar('Pancakes')
+
+        self.recipes['Crepes'].ingredients.remove(self.ingredients['Milk'])
+        self.assertEqual(self.stale(), {'Pancakes', 'Crepes', 'Waffles'})
+        self.assertEqual(self.similar('Pancakes'),
+                         [('Crepes', 0.75), ('Waffles', 0.6)])
+
+        models.Recipe.objects.set_links('tags', {
+            self.recipes['Salad'].id: {self.sweet.id},
+        })
+        self.assertEqual(self.stale(), set(self.recipes))
+        self.assertEqual(self.similar('Pancakes'),
+                         [('Crepes', 0.75), ('Waffles', 0.6), ('Salad', 0.2)])
+
+    def test_stale_list_served_until_built(self):
+        """Test lists are served stale and missing ones queued"""
+        self.similar('Pancakes')
+        self.recipes['Crepes'].ingredients.remove(self.ingredients['Milk'])
+
+        similarity = models.RecipeSimilarity.objects.for_recipe(
+            self.recipes['Pancakes'])
+
+        self.assertEqual(similarity.scores, [1.0, 0.6])
+        models.RecipeSimilarity.objects.all().delete()
+        similarity = models.RecipeSimilarity.objects.for_recipe(
+            self.recipes['Pancakes'])
+        self.assertEqual(similarity.similar_ids, [])
+        self.assertEqual(self.stale(), {'Pancakes'})
+
+    def test_deletions_mark_lists_stale(self):
+        """Test deleted tags and recipes update the lists showing them"""
+        self.similar('Pancakes')
+        self.sweet.delete()
+        self.assertEqual(self.similar('Pancakes'),
+                         [('Crepes', 1.0), ('Waffles', 0.5)])
+
+        self.recipes['Crepes'].delete()
+        self.assertEqual(self.similar('Pancakes'), [('Waffles', 0.5)])
+
+
+class UserStatsTests(TestCase):
+    """Test the recipe counters of users follow recipe writes"""
+
+    def setUp(self):
+        self.user = create_user()
+
+    def create_recipe(self, time_minutes, price):
+        return models.Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=time_minutes,
+            price=price)
+
+    def assertStats(self, recipe_count, total_time_minutes, total_price):
+        stats = models.UserStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.recipe_count, stats.total_time_minutes, stats.total_price),
+            (recipe_count, total_time_minutes, Decimal(total_price)),
+        )
+
+    def test_saved_recipes_counted(self):
+        """Test created, edited and deleted recipes are counted"""
+        soup = self.create_recipe(10, '2.50')
+        self.create_recipe(20, Decimal('4.00'))
+        self.assertStats(2, 30, '6.50')
+
+        soup.time_minutes = 15
+        soup.save(update_fields=['time_minutes'])
+        soup = models.Recipe.objects.defer('price').get(pk=soup.pk)
+        soup.price = Decimal('1.50')
+        soup.save()
+        self.assertStats(2, 35, '5.50')
+
+        soup.delete()
+        self.assertStats(1, 20, '4.00')
+
+    def test_bulk_writes_counted(self):
+        """Test bulk creates, updates and deletes are counted"""
+        models.Recipe.objects.bulk_create([
+            models.Recipe(user=self.user, title='Soup', time_minutes=i,
+                          price=Decimal('1.00'))
+            for i in range(1, 4)
+        ])
+        self.assertStats(3, 6, '3.00')
+
+        recipes = list(models.Recipe.objects.all())
+        for recipe in recipes:
+            recipe.price = Decimal('2.00')
+        models.Recipe.objects.bulk_update(recipes, ['price'])
+        self.assertStats(3, 6, '6.00')
+
+        models.Recipe.objects.filter(time_minutes__lt=3).update(
+            time_minutes=10)
+        self.assertStats(3, 23, '6.00')
+
+        models.Recipe.objects.filter(time_minutes=10).delete()
+        self.assertStats(1, 3, '2.00')
+
+    def test_rebuild(self):
+        """Test stats are recomputed from the recipes"""
+        self.create_recipe(10, '2.50')
+        models.UserStats.objects.filter(user=self.user).update(
+            recipe_count=7)
+
+        models.UserStats.objects.rebuild(
+            get_user_model().objects.filter(pk=self.user.pk))
+
+        self.assertStats(1, 10, '2.50')
+
+    def test_stale_instances_counted_from_stored_values(self):
+        """Test saves count their change to the row, not to what was loaded"""
+        soup = self.create_recipe(10, '5.00')
+        first = models.Recipe.objects.get(pk=soup.pk)
+        second = models.Recipe.objects.get(pk=soup.pk)
+
+        first.price = Decimal('7.00')
+        first.save()
+        second.price = Decimal('9.00')
+        second.save()
+
+        self.assertStats(1, 10, '9.00')
+
+
+class ConcurrentUserStatsTests(TransactionTestCase):
+    """Test the recipe counters of users under concurrent writes"""
+
+    def test_concurrent_saves_counted_once(self):
+        """Test saves of one recipe read its values one after the other"""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=10, price=Decimal('5.00'))
+        loaded = threading.Barrier(2)
+
+        def save(price, time_minutes):
+            try:
+                with transaction.atomic():
+                    other = models.Recipe.objects.get(pk=recipe.pk)
+                    loaded.wait(timeout=5)
+                    other.price = price
+                    other.time_minutes = time_minutes
+                    other.save()
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=save, args=(Decimal('7.00'), 20)),
+            threading.Thread(target=save, args=(Decimal('9.00'), 30)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        recipe.refresh_from_db()
+        stats = models.UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.total_time_minutes, stats.total_price),
+            (recipe.time_minutes, recipe.price),
+        )
+
+    def test_concurrent_updates_counted_once(self):
+        """Test overlapping queryset updates add up to the stored totals"""
+        user = create_user()
+        models.Recipe.objects.bulk_create([
+            models.Recipe(user=user, title='Soup', time_minutes=10,
+                          price=Decimal('1.00'))
+            for _ in range(20)
+        ])
+
+        def update(price):
+            try:
+                models.Recipe.objects.filter(user=user).update(price=price)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=update, args=(Decimal(price),))
+                   for price in ('2.00', '3.00', '4.00')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = models.UserStats.objects.get(user=user)
+        self.assertEqual(stats.total_price, sum(
+            models.Recipe.objects.values_list('price', flat=True)))
+
+
+class ConcurrentPantryEntryTests(TransactionTestCase):
+    """Test the pantry matrix under concurrent refreshes"""
+
+    def test_concurrent_refreshes_run_in_turn(self):
+        """Test a refresh waits for one of the same recipe to commit"""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Bread', time_minutes=5, price=Decimal('1'))
+        flour = models.Ingredient.objects.create(user=user, name='Flour')
+        recipe.ingredients.add(flour)
+        refreshed = threading.Event()
+
+        def refresh():
+            try:
+                with transaction.atomic():
+                    models.PantryEntry.objects.refresh([recipe.id])
+                    refreshed.set()
+                    time.sleep(0.5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=refresh)
+        thread.start()
+        refreshed.wait(timeout=5)
+        models.PantryEntry.objects.refresh([recipe.id])
+        thread.join()
+
+        self.assertEqual(
+            list(models.PantryEntry.objects.values_list(
+                'recipe_id', 'ingredient_id', 'ingredient_count')),
+            [(recipe.id, flour.id, 1)],
+        )
@@ -0,0 +1,90 @@
+"""
+Response cache for the recipe list APIs.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.response import Response
+
+METRICS = ('hits', 'misses', 'evictions')
+
+
+def get_list_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def count_metric(name, delta=1):
+    """Add delta to a list cache metric kept in the metrics cache"""
+    cache = caches[settings.METRICS_CACHE_ALIAS]
+    key = f'list-cache:{name}'
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Only one worker adds the missing counter, the others increment.
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def get_metrics():
+    """Return the list cache metrics counted by every worker"""
+    cache = caches[settings.METRICS_CACHE_ALIAS]
+    counts = cache.get_many([f'list-cache:{name}' for name in METRICS])
+
+    return {name: counts.get(f'list-cache:{name}', 0) for name in METRICS}
+
+
+class MeteredLocMemCache(LocMemCache):
+    """Per-process LRU cache counting evicted entries"""
+
+    def _cull(self):
+        size = len(self._cache)
+        super()._cull()
+        count_metric('evictions', size - len(self._cache))
+
+
+class MeteredFileBasedCache(FileBasedCache):
+    """Cache shared by workers through files, counting evicted entries"""
+    _culling = False
+
+    def _cull(self):
+        self._culling = True
+        try:
+            super()._cull()
+        finally:
+            self._culling = False
+
+    def _delete(self, fname):
+        deleted = super()._delete(fname)
+        if deleted and self._culling:
+            count_metric('evictions')
+
+        return deleted
+
+
+class CachedListMixin:
+    """Serve list responses from the list cache
+
+    Entries are keyed by the list ETag of `ConditionalMixin`, which
+    covers the user's revision, the normalized query parameters and the
+    renderer. Writes bump the revision, so stale entries are never read
+    again and simply age out of the cache.
+    """
+
+    def get_list_cache_key(self):
+        return (f'list:{self.request.user.pk}:{self.request.get_host()}:'
+                f'{self.get_list_etag()}')
+
+    def list(self, request, *args, **kwargs):
+        cache = get_list_cache()
+        key = self.get_list_cache_key()
+        data = cache.get(key)
+        if data is not None:
+            count_metric('hits')
+            return Response(data)
+
+        count_metric('misses')
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data)
+
+        return response
@@ -0,0 +1,137 @@
+"""
+Conditional requests for the recipe APIs.
+"""
+import hashlib
+from calendar import timegm
+
+from django.contrib.auth import get_user_model
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, urlencode
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has been modified.'
+    default_code = 'precondition_failed'
+
+
+def make_etag(*parts):
+    """Return a strong ETag for the given version parts"""
+    digest = hashlib.sha1(
+        '\0'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+    return quote_etag(digest)
+
+
+class ConditionalMixin:
+    """Answer conditional requests from version stamps
+
+    List ETags are derived from the user's revision and the request URL,
+    object ETags from the object's `updated_at`, so neither requires
+    loading or serializing the payload. Matching If-None-Match or
+    If-Modified-Since headers on reads get a 304, failed If-Match or
+    If-Unmodified-Since preconditions on writes get a 412.
+    """
+    # Actions posting a query rather than a change.
+    read_only_actions = ()
+
+    def get_list_etag(self):
+        """Return the list ETag, reading the revision once per request"""
+        if getattr(self, '_list_etag', None) is None:
+            revision = get_user_model().objects.filter(
+                pk=self.request.user.pk
+            ).values_list('revision', flat=True).get()
+            self._list_etag = make_etag(
+                'list',
+                revision,
+                self.request.path,
+                urlencode(sorted(self.request.query_params.lists()),
+                          doseq=True),
+                self.request.accepted_renderer.format,
+            )
+
+        return self._list_etag
+
+    def get_object_etag(self, obj):
+        return make_etag(
+            obj._meta.label,
+            obj.pk,
+            obj.updated_at.isoformat(),
+            self.request.accepted_renderer.format,
+        )
+
+    def _conditional_response(self, etag, updated_at=None):
+        """Return a 304 or 412 response when a precondition says so"""
+        return get_conditional_response(
+            self.request,
+            etag=etag,
+            last_modified=updated_at and timegm(updated_at.utctimetuple()),
+        )
+
+    def _set_validators(self, response, etag, updated_at=None):
+        response['ETag'] = etag
+        if updated_at is not None:
+            response['Last-Modified'] = http_date(
+                timegm(updated_at.utctimetuple()))
+
+        return response
+
+    def get_object(self):
+        """Check write preconditions against the object being changed"""
+        obj = super().get_object()
+        if self.request.method not in SAFE_METHODS:
+            etag = self.get_object_etag(obj)
+            if self._conditional_response(etag, obj.updated_at) is not None:
+                raise PreconditionFailed()
+
+        return obj
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag()
+        response = self._conditional_response(etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+
+        return self._set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_object_etag(instance)
+        response = self._conditional_response(etag, instance.updated_at)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+
+        return self._set_validators(response, etag, instance.updated_at)
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+
+        if getattr(instance, '_prefetched_objects_cache', None):
+            # Links may have changed since they were prefetched.
+            instance._prefetched_objects_cache = {}
+
+        return self._set_validators(
+            Response(serializer.data),
+            self.get_object_etag(instance),
+            instance.updated_at,
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Bump the user's revision after any successful write"""
+        if (response.status_code < 400
+                and request.method not in SAFE_METHODS
+                and self.action not in self.read_only_actions
+                and request.user.is_authenticated):
+            get_user_model().objects.bump_revision(request.user)
+
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,119 @@
+"""
+Streaming exports of recipe libraries.
+"""
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import renderers
+
+from core.models import Recipe
+
+RECIPE_FIELDS = ['id', 'title', 'description', 'time_minutes',
+                 'price', 'link']
+EXPORT_FIELDS = RECIPE_FIELDS + ['tags', 'ingredients']
+CSV_NAME_SEPARATOR = '|'
+CHUNK_SIZE = 2000
+
+
+def _names_by_recipe(field_name, recipe_ids):
+    """Return the linked object names of each recipe"""
+    field = Recipe._meta.get_field(field_name)
+    rows = field.remote_field.through.objects.filter(
+        **{f'{field.m2m_field_name()}_id__in': recipe_ids}
+    ).values_list(
+        f'{field.m2m_field_name()}_id',
+        f'{field.m2m_reverse_field_name()}__name',
+    ).order_by(f'{field.m2m_reverse_field_name()}__name')
+
+    names = defaultdict(list)
+    for recipe_id, name in rows:
+        names[recipe_id].append(name)
+
+    return names
+
+
+def iter_recipe_chunks(queryset, chunk_size=None):
+    """Yield lists of recipe dicts including tag and ingredient names
+
+    Recipes are read through a server-side cursor and their tags and
+    ingredients are fetched once per chunk, so memory use depends on the
+    chunk size rather than on the size of the library.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    rows = queryset.prefetch_related(None).values(
+        *RECIPE_FIELDS
+    ).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        recipe_ids = [row['id'] for row in chunk]
+        tags = _names_by_recipe('tags', recipe_ids)
+        ingredients = _names_by_recipe('ingredients', recipe_ids)
+        for row in chunk:
+            row['tags'] = tags.get(row['id'], [])
+            row['ingredients'] = ingredients.get(row['id'], [])
+
+        yield chunk
+
+
+def ndjson_stream(queryset, chunk_size=None):
+    """Yield recipes as newline delimited JSON, one chunk at a time"""
+    for chunk in iter_recipe_chunks(queryset, chunk_size):
+        yield ''.join(
+            json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in chunk
+        )
+
+
+class _Echo:
+    """File-like object returning what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(queryset, chunk_size=None):
+    """Yield recipes as CSV with joined tag and ingredient names"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+
+    for chunk in iter_recipe_chunks(queryset, chunk_size):
+        yield ''.join(
+            writer.writerow([
+                CSV_NAME_SEPARATOR.join(row[field])
+                if field in ('tags', 'ingredients') else row[field]
+                for field in EXPORT_FIELDS
+            ])
+            for row in chunk
+        )
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """Negotiates NDJSON exports and renders errors as a single line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode()
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """Negotiates CSV exports and renders errors as a single row"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        writer = csv.writer(_Echo())
+        return (writer.writerow(data.keys())
+                + writer.writerow(data.values())).encode()
@@ -0,0 +1,114 @@
+"""
+Background generation of recipe image renditions.
+"""
+import io
+
+from PIL import Image, ImageOps, features
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from core.models import (
+    ImageBlob,
+    Recipe,
+    RecipeImageJob,
+    recipe_image_file_path,
+)
+
+# Bounding box and format of each rendition.
+RENDITIONS = {
+    'thumbnail': ((200, 200), 'JPEG'),
+    'medium': ((800, 800), 'JPEG'),
+    'webp': ((800, 800), 'WEBP'),
+}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+QUALITY = 85
+MAX_ATTEMPTS = 3
+
+
+def enqueue_renditions(recipe):
+    """Queue the renditions of the recipe's current image"""
+    return RecipeImageJob.objects.create(recipe=recipe,
+                                         image=recipe.image.name)
+
+
+def make_renditions(image_file):
+    """Save the renditions of an image and return their names
+
+    Images are rotated as their EXIF orientation says, then written
+    without any metadata. Formats missing from the Pillow build are
+    skipped.
+    """
+    storage = image_file.storage
+    with image_file.open('rb'), Image.open(image_file) as img:
+        # Let JPEG decoding scale down by itself before resizing.
+        largest = max(size for size, _ in RENDITIONS.values())
+        img.draft('RGB', largest)
+        img = ImageOps.exif_transpose(img).convert('RGB')
+
+    names = {}
+    for rendition, (size, image_format) in RENDITIONS.items():
+        if image_format == 'WEBP' and not features.check('webp'):
+            continue
+        resized = img.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        content = io.BytesIO()
+        resized.save(content, image_format, quality=QUALITY)
+        names[rendition] = storage.save(
+            recipe_image_file_path(
+                None, f'{rendition}.{EXTENSIONS[image_format]}'),
+            ContentFile(content.getvalue()),
+        )
+
+    return names
+
+
+def process_next_job():
+    """Process the oldest pending job, returning False when none is left
+
+    The job row stays locked while it is processed and is skipped by
+    other workers, so several workers can share the table. Renditions
+    are stored under a lock of the recipe, and only while the recipe
+    still shows the image they were made from.
+    """
+    with transaction.atomic():
+        job = RecipeImageJob.objects.select_for_update(
+            skip_locked=True,
+            of=('self',),
+        ).filter(
+            attempts__lt=MAX_ATTEMPTS,
+        ).select_related('recipe__user').order_by('id').first()
+        if job is None:
+            return False
+
+        recipe = job.recipe
+        if recipe.image.name != job.image:
+            # The image was replaced and has a newer job.
+            job.delete()
+            return True
+
+        try:
+            renditions = make_renditions(recipe.image)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            job.attempts += 1
+            job.error = str(exc)
+            job.save(update_fields=['attempts', 'error'])
+            return True
+
+        ImageBlob.objects.acquire(renditions.values())
+        # The image may have been replaced while the renditions were made.
+        recipe = Recipe.objects.filter(pk=recipe.pk).lock().select_related(
+            'user').first()
+        if recipe is None or recipe.image.name != job.image:
+            ImageBlob.objects.release(renditions.values())
+            job.delete()
+            return True
+
+        ImageBlob.objects.release(recipe.image_renditions.values())
+        recipe.image_renditions = renditions
+        recipe.save(update_fields=['image_renditions', 'updated_at'])
+        job.delete()
+        get_user_model().objects.bump_revision(recipe.user)
+
+    return True
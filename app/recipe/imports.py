@@ -0,0 +1,180 @@
+"""
+Streaming imports of recipe libraries.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from core.models import (Recipe,
+                         Tag,
+                         Ingredient,
+                         )
+from .exports import CSV_NAME_SEPARATOR
+from .serializers import RecipeImportSerializer
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+def read_ndjson(lines):
+    """Yield recipe dicts from newline delimited JSON"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def read_csv(lines):
+    """Yield recipe dicts from CSV in the export layout"""
+    for row in csv.DictReader(lines):
+        for field_name in ('tags', 'ingredients'):
+            names = row.get(field_name) or ''
+            row[field_name] = [
+                name for name in names.split(CSV_NAME_SEPARATOR) if name
+            ]
+        yield row
+
+
+def read_rows(stream, file_format):
+    """Yield recipe dicts from a text stream in the given format"""
+    if file_format == 'csv':
+        return read_csv(stream)
+    return read_ndjson(stream)
+
+
+class RecipeImporter:
+    """Write parsed recipe rows for a user in bounded batches
+
+    Each batch is validated row by row, then written in its own
+    transaction with one bulk insert for the recipes and one insert per
+    relation for the links. Tag and ingredient names are resolved through
+    in-memory lookup tables that only hit the database for new names.
+    """
+
+    def __init__(self, user, batch_size=BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self._validator = RecipeImportSerializer()
+        self._lookups = {Tag: {}, Ingredient: {}}
+
+    def run(self, rows, start=0, on_batch=None):
+        """Import rows after the first `start` and return rows processed
+
+        `on_batch` is called with the number of rows processed so far each
+        time a batch has been committed.
+        """
+        rows = islice(rows, start, None)
+        done = start
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return done
+
+            self._import_batch(batch, first_row=done + 1)
+            done += len(batch)
+            if on_batch:
+                on_batch(done)
+
+    def _validate(self, row, row_number):
+        """Return validated data for a row, or None if it is invalid"""
+        if isinstance(row, dict):
+            row = dict(row)
+            for field_name in ('tags', 'ingredients'):
+                items = row.get(field_name)
+                if items is None:
+                    row.pop(field_name, None)
+                elif isinstance(items, list):
+                    row[field_name] = [
+                        item.get('name') if isinstance(item, dict) else item
+                        for item in items
+                    ]
+
+        try:
+            return self._validator.run_validation(row)
+        except ValidationError as exc:
+            self.failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({'row': row_number, 'errors': exc.detail})
+
+    def _resolve(self, model, names):
+        """Return a name to id lookup covering the given names"""
+        lookup = self._lookups[model]
+        missing = [name for name in names if name not in lookup]
+        if missing:
+            objs = model.objects.get_or_create_by_names(self.user, missing)
+            lookup.update((name, obj.id) for name, obj in objs.items())
+
+        return lookup
+
+    def _link(self, field_name, links):
+        """Insert new recipe links, through COPY on PostgreSQL"""
+        if not links:
+            return
+        if connection.vendor != 'postgresql':
+            Recipe.objects.add_links(field_name, links)
+            return
+
+        field = Recipe._meta.get_field(field_name)
+        buffer = io.StringIO(''.join(
+            f'{recipe_id}\t{obj_id}\n' for recipe_id, obj_id in links
+        ))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {field.remote_field.through._meta.db_table} '
+                f'({field.m2m_column_name()}, {field.m2m_reverse_name()}) '
+                f'FROM STDIN',
+                buffer,
+            )
+        Recipe.objects.count_links(field_name, links)
+
+    def _import_batch(self, batch, first_row):
+        valid = []
+        for offset, row in enumerate(batch):
+            data = self._validate(row, first_row + offset)
+            if data is not None:
+                valid.append(data)
+        if not valid:
+            return
+
+        try:
+            with transaction.atomic():
+                recipes = Recipe.objects.bulk_create([
+                    Recipe(user=self.user, **{
+                        attr: value for attr, value in data.items()
+                        if attr not in ('tags', 'ingredients')
+                    })
+                    for data in valid
+                ])
+                for model, field_name in ((Tag, 'tags'),
+                                          (Ingredient, 'ingredients')):
+                    lookup = self._resolve(model, [
+                        name
+                        for data in valid
+                        for name in data.get(field_name, [])
+                    ])
+                    self._link(field_name, {
+                        (recipe.id, lookup[name])
+                        for recipe, data in zip(recipes, valid)
+                        for name in data.get(field_name, [])
+                    })
+                Recipe.objects.update_search_vectors(
+                    [recipe.id for recipe in recipes])
+        except Exception:
+            # Names created inside the rolled back transaction are gone.
+            for lookup in self._lookups.values():
+                lookup.clear()
+            raise
+
+        self.imported += len(valid)
+        get_user_model().objects.bump_revision(self.user)
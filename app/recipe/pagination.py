@@ -0,0 +1,154 @@
+"""
+Pagination for the recipe APIs.
+"""
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def _reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}'
+                 for field in ordering)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over a user's recipes, newest first.
+
+    Querysets ordered by the view, such as ranked search results or
+    recipes sorted by price, are paged in their own ordering. Cursors
+    hold the value of every ordering field, so an ordering ending with a
+    unique field pages exactly and seeks straight to the next page,
+    however many rows share its leading fields. They also hold the
+    ordering itself, and are rejected when reused with another one.
+    """
+    ordering = '-id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return (tuple(queryset.query.order_by)
+                or super().get_ordering(request, queryset, view))
+
+    def _following(self, ordering, position):
+        """Return the filter of the rows after the position in the ordering
+
+        The leading field is bounded on its own too, which Postgres can
+        seek to in an index on the ordering.
+        """
+        following = None
+        for field, value in reversed(list(zip(ordering, position))):
+            name = field.lstrip('-')
+            op = 'lt' if field.startswith('-') else 'gt'
+            after = Q(**{f'{name}__{op}': value})
+            if following is not None:
+                after |= Q(**{name: value}) & following
+            following = after
+
+        return Q(**{f'{name}__{op}e': value}) & following
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        ordering = (_reverse_ordering(self.ordering) if reverse
+                    else self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(
+                    self._following(ordering, current_position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return cursor
+
+        # Cursors hold their ordering and one position value per field.
+        querystring = b64decode(
+            request.query_params[self.cursor_query_param].encode('ascii'),
+        ).decode('ascii')
+        tokens = parse.parse_qs(querystring, keep_blank_values=True)
+        if tokens.get('k') != list(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor.position is None:
+            return cursor
+        if len(tokens['p']) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return cursor._replace(position=tokens['p'])
+
+    def encode_cursor(self, cursor):
+        tokens = {'k': self.ordering}
+        if cursor.offset != 0:
+            tokens['o'] = str(cursor.offset)
+        if cursor.reverse:
+            tokens['r'] = '1'
+        if cursor.position is not None:
+            tokens['p'] = cursor.position
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return [
+            str(instance[name] if isinstance(instance, dict)
+                else getattr(instance, name))
+            for name in (field.lstrip('-') for field in ordering)
+        ]
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """Keyset pagination over a user's tags or ingredients."""
+    ordering = '-name'
@@ -1,7 +1,35 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from core.models import (Recipe,
                          Tag,
-                         Ingredient)
+                         Ingredient,
+                         UserStats)
+
+BULK_MAX_ITEMS = 1000
+# Most recipes returned by a pantry match.
+PANTRY_MAX_RESULTS = 100
+# Recipe text indexed for search, besides tag and ingredient names.
+SEARCHED_FIELDS = ('title', 'description')
+
+
+def _changes_search_text(instance, data):
+    """Return whether the data edits text indexed for search"""
+    return any(
+        field in data and data[field] != getattr(instance, field)
+        for field in SEARCHED_FIELDS
+    )
+
+
+def _rendition_url(serializer, recipe, rendition):
+    """Return the URL of an image rendition, or None while it's pending"""
+    name = recipe.image_renditions.get(rendition)
+    if not name:
+        return None
+    url = recipe.image.storage.url(name)
+    request = serializer.context.get('request')
+
+    return request.build_absolute_uri(url) if request else url
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -20,76 +48,360 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class TagDetailSerializer(TagSerializer):
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['usage_count']
+        read_only_fields = ['id', 'usage_count']
+
+
+class IngredientDetailSerializer(IngredientSerializer):
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['usage_count']
+        read_only_fields = ['id', 'usage_count']
+
+
+class RecipeBulkSerializer(serializers.ListSerializer):
+    """Create or update many recipes with batched queries."""
+
+    def _get_or_create_attrs(self, model, items, field_name):
+        """Resolve the names used across all items in one batch."""
+        auth_user = self.context['request'].user
+        return model.objects.get_or_create_by_names(auth_user, [
+            attr['name']
+            for item in items
+            for attr in item.get(field_name) or []
+        ])
+
+    def create(self, validated_data):
+        """Create recipes with bulk inserts."""
+        tag_objs = self._get_or_create_attrs(Tag, validated_data, 'tags')
+        ingredient_objs = self._get_or_create_attrs(
+            Ingredient, validated_data, 'ingredients')
+
+        recipes = Recipe.objects.bulk_create([
+            Recipe(**{
+                attr: value for attr, value in item.items()
+                if attr not in ('tags', 'ingredients')
+            })
+            for item in validated_data
+        ])
+        Recipe.objects.add_links('tags', {
+            (recipe.id, tag_objs[tag['name']].id)
+            for recipe, item in zip(recipes, validated_data)
+            for tag in item.get('tags', [])
+        })
+        Recipe.objects.add_links('ingredients', {
+            (recipe.id, ingredient_objs[ingredient['name']].id)
+            for recipe, item in zip(recipes, validated_data)
+            for ingredient in item.get('ingredients', [])
+        })
+        Recipe.objects.update_search_vectors(
+            [recipe.id for recipe in recipes])
+
+        return recipes
+
+    def update(self, instances, validated_data):
+        """Update recipes, matched to items by position, in bulk."""
+        tag_objs = self._get_or_create_attrs(Tag, validated_data, 'tags')
+        ingredient_objs = self._get_or_create_attrs(
+            Ingredient, validated_data, 'ingredients')
+
+        searched = {
+            instance.id
+            for instance, item in zip(instances, validated_data)
+            if _changes_search_text(instance, item)
+        }
+        links = {'tags': {}, 'ingredients': {}}
+        # bulk_update skips auto_now, and link changes alone count as edits.
+        fields = {'updated_at'}
+        now = timezone.now()
+        for instance, item in zip(instances, validated_data):
+            instance.updated_at = now
+            for field_name, objs in (('tags', tag_objs),
+                                     ('ingredients', ingredient_objs)):
+                attrs = item.pop(field_name, None)
+                if attrs is None:
+                    continue
+                links[field_name][instance.id] = {
+                    objs[a['name']].id for a in attrs
+                }
+
+            for attr, value in item.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+
+        for field_name, wanted in links.items():
+            if wanted:
+                searched |= Recipe.objects.set_links(field_name, wanted)
+        Recipe.objects.bulk_update(instances, fields)
+        Recipe.objects.update_search_vectors(searched)
+
+        return instances
+
+
+class SparseFieldsMixin:
+    """Build only the fields and nest only the relations asked for
+
+    The `fields` and `expand` entries of the context name them, and
+    every field is built or every relation nested when they are None.
+    Relations left out of `expand` are listed by id.
+    """
+    # Nested relations that can be listed by id instead.
+    expandable_fields = ()
+    # Model columns read by fields that aren't model fields themselves.
+    field_columns = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is not None:
+            fields = {name: field for name, field in fields.items()
+                      if name in selected}
+        expand = self.context.get('expand')
+        if expand is not None:
+            for name in fields.keys() & set(self.expandable_fields) - expand:
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=True, read_only=True)
+
+        return fields
+
+    @classmethod
+    def columns(cls, fields):
+        """Return the model columns read by the given fields"""
+        model_fields = {field.name
+                        for field in cls.Meta.model._meta.concrete_fields}
+        columns = set()
+        for name in fields:
+            columns.update(cls.field_columns.get(
+                name, [name] if name in model_fields else []))
+
+        return columns
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    thumbnail = serializers.SerializerMethodField()
+
+    expandable_fields = ('tags', 'ingredients')
+    field_columns = {
+        'thumbnail': ('image', 'image_renditions'),
+        'renditions': ('image', 'image_renditions'),
+    }
 
     class Meta:
         model = Recipe
         fields = ['id', 'title', 'time_minutes',
-                  'price', 'link', 'tags', 'ingredients']
+                  'price', 'link', 'tags', 'ingredients', 'thumbnail']
         read_only_fields = ['id']
+        list_serializer_class = RecipeBulkSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
+    def get_thumbnail(self, recipe):
+        return _rendition_url(self, recipe, 'thumbnail')
+
+    def _get_or_create_tags(self, tags):
         """Handle getting or creating tags as needed."""
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
-
-    def _get_or_create_ingredients(self, ingredients, recipe):
+        return Tag.objects.get_or_create_by_names(
+            auth_user,
+            [tag['name'] for tag in tags],
+        ).values()
+
+    def _get_or_create_ingredients(self, ingredients):
         """Handle getting or creating ingredients as needed."""
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        return Ingredient.objects.get_or_create_by_names(
+            auth_user,
+            [ingredient['name'] for ingredient in ingredients],
+        ).values()
 
     def create(self, validated_data):
         """Create a recipe."""
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        Recipe.objects.add_links('tags', [
+            (recipe.id, tag.id) for tag in self._get_or_create_tags(tags)
+        ])
+        Recipe.objects.add_links('ingredients', [
+            (recipe.id, ingredient.id)
+            for ingredient in self._get_or_create_ingredients(ingredients)
+        ])
+        Recipe.objects.update_search_vectors([recipe.id])
 
         return recipe
 
+    def _set_links(self, recipe, field_name, objs):
+        """Link exactly the given objects to a recipe, writing only changes."""
+        return Recipe.objects.set_links(
+            field_name,
+            {recipe.id: {obj.id for obj in objs}},
+        )
+
     def update(self, instance, validated_data):
         """Update recipe."""
+        # Concurrent updates of the recipe apply one after the other, each
+        # to the fields and links the previous one stored.
+        Recipe.objects.filter(pk=instance.pk).lock()
+        instance.refresh_from_db()
+        searched = _changes_search_text(instance, validated_data)
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            searched |= bool(self._set_links(
+                instance, 'ingredients',
+                self._get_or_create_ingredients(ingredients),
+            ))
 
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            searched |= bool(self._set_links(
+                instance, 'tags', self._get_or_create_tags(tags)))
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
         instance.save()
+        if searched:
+            Recipe.objects.update_search_vectors([instance.id])
         return instance
 
 
-class RecipeDetailSerializer(RecipeSerializer):
+class SimilarRecipeSerializer(RecipeSerializer):
+    similarity = serializers.FloatField(
+        read_only=True,
+        help_text='Jaccard index of the tags and ingredients of both '
+                  'recipes.',
+    )
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + ['similarity']
+
+
+class RecipeRenditionsMixin(serializers.Serializer):
+    renditions = serializers.SerializerMethodField()
+
+    def get_renditions(self, recipe):
+        return {
+            rendition: _rendition_url(self, recipe, rendition)
+            for rendition in recipe.image_renditions
+        }
+
+
+class RecipeDetailSerializer(RecipeRenditionsMixin, RecipeSerializer):
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['description', 'image',
+                                                 'renditions']
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """Validate imported rows, with tags and ingredients as plain names."""
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+    )
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ['title', 'description', 'time_minutes',
+                  'price', 'link', 'tags', 'ingredients']
+
+
+class StreamedImageField(serializers.ImageField):
+    """Image field trusting uploads already checked while streamed in"""
+
+    def to_internal_value(self, data):
+        if getattr(data, 'image_format', None):
+            # Skip reopening the file with Pillow.
+            return serializers.FileField.to_internal_value(self, data)
+
+        return super().to_internal_value(data)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(RecipeRenditionsMixin,
+                            serializers.ModelSerializer):
+    image = StreamedImageField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'renditions']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}}
+
+
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+
+
+class RecipeRangeSerializer(serializers.Serializer):
+    min_time = serializers.IntegerField(min_value=0, required=False)
+    max_time = serializers.IntegerField(min_value=0, required=False)
+    min_price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         min_value=0, required=False)
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=PANTRY_MAX_RESULTS,
+        default=settings.API_PAGE_SIZE,
+    )
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+    )
+
+
+class ShoppingListItemSerializer(IngredientSerializer):
+    recipes = serializers.IntegerField(
+        read_only=True,
+        help_text='Number of the selected recipes using the ingredient.',
+    )
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipes']
+
+
+class PantryMatchSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    coverage = serializers.FloatField(
+        help_text='Share of the recipe ingredients in the pantry.',
+    )
+    missing = IngredientSerializer(many=True)
+
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    average_time_minutes = serializers.FloatField(read_only=True)
+    average_price = serializers.DecimalField(max_digits=14,
+                                             decimal_places=2,
+                                             read_only=True)
+    top_tags = TagDetailSerializer(many=True, read_only=True)
+    top_ingredients = IngredientDetailSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UserStats
+        fields = ['recipe_count', 'average_time_minutes', 'total_price',
+                  'average_price', 'top_tags', 'top_ingredients']
+        read_only_fields = fields
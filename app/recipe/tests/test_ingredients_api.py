@@ -8,7 +8,8 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Ingredient, Recipe
-from recipe.serializers import IngredientSerializer
+from recipe.serializers import IngredientDetailSerializer
+from recipe.views import TYPEAHEAD_LIMIT
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
 
@@ -52,9 +53,9 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         ingredients = Ingredient.objects.all().order_by('-name')
-        serializer = IngredientSerializer(ingredients, many=True)
+        serializer = IngredientDetailSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test list of ingredients is limited to authenticated user"""
@@ -65,9 +66,9 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
-        self.assertEqual(res.data[0]['id'], ingredient.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
+        self.assertEqual(res.data['results'][0]['id'], ingredient.id)
 
     def test_update_ingredient(self):
         """Test updating an ingredient"""
@@ -105,10 +106,11 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        s1 = IngredientSerializer(in1)
-        s2 = IngredientSerializer(in2)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        in1.refresh_from_db()
+        s1 = IngredientDetailSerializer(in1)
+        s2 = IngredientDetailSerializer(in2)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         """Test filtered ingredients returns a unique list"""
@@ -131,4 +133,68 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_typeahead_ranks_matches(self):
+        """Test typeahead ranks exact, prefix, then most used matches"""
+        names = ['Salt', 'Sea salt', 'Salted butter', 'Celery salt',
+                 'Pepper']
+        ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in names
+        }
+        recipe = Recipe.objects.create(title='Soup', time_minutes=5,
+                                       price=Decimal('1.00'), user=self.user)
+        recipe.ingredients.add(ingredients['Celery salt'])
+        other = create_user(email='other@example.com')
+        Ingredient.objects.create(user=other, name='Salt flakes')
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'SALT'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in res.data],
+            ['Salt', 'Salted butter', 'Celery salt', 'Sea salt'],
+        )
+        self.assertEqual(set(res.data[0]), {'id', 'name'})
+
+    def test_typeahead_matches_every_word_prefix(self):
+        """Test each typed word must start a word of the name"""
+        Ingredient.objects.create(user=self.user, name='Red bell pepper')
+        Ingredient.objects.create(user=self.user, name='Red onion')
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'pep re'})
+
+        self.assertEqual([i['name'] for i in res.data], ['Red bell pepper'])
+        res = self.client.get(INGREDIENTS_URL, {'q': ' & '})
+        self.assertEqual(res.data, [])
+        res = self.client.get(INGREDIENTS_URL, {'q': 'r'})
+        self.assertEqual(res.data, [])
+
+    def test_typeahead_falls_back_to_similar_names(self):
+        """Test names similar to the text follow the word prefix matches"""
+        names = ['Cinnamon sticks', 'Cumin', 'Cinnamon', 'Cinamon sugar']
+        ingredients = {
+            name: Ingredient.objects.create(user=self.user, name=name)
+            for name in names
+        }
+        recipe = Recipe.objects.create(title='Buns', time_minutes=5,
+                                       price=Decimal('1.00'), user=self.user)
+        recipe.ingredients.add(ingredients['Cinnamon sticks'])
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'cinamon'})
+
+        self.assertEqual(
+            [ingredient['name'] for ingredient in res.data],
+            ['Cinamon sugar', 'Cinnamon', 'Cinnamon sticks'],
+        )
+
+    def test_typeahead_limited(self):
+        """Test typeahead returns a bounded number of suggestions"""
+        Ingredient.objects.bulk_create([
+            Ingredient(user=self.user, name=f'Flour {i}') for i in range(15)
+        ])
+
+        res = self.client.get(INGREDIENTS_URL, {'q': 'flo'})
+
+        self.assertEqual(len(res.data), TYPEAHEAD_LIMIT)
@@ -2,27 +2,51 @@
 Tests for recipe APIs.
 """
 from decimal import Decimal
+from unittest.mock import patch
+import csv
+import hashlib
+import io
+import json
 import tempfile
+import threading
+import time
 import os
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import (Recipe,
+from core.models import (ImageBlob,
+                         Recipe,
+                         RecipeImageJob,
+                         RecipeSimilarity,
                          Tag,
                          Ingredient,
                          )
+from recipe.cache import MeteredLocMemCache, get_metrics
+from recipe.images import make_renditions, process_next_job
+from recipe.uploads import ImageUploadHandler
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+EXPORT_URL = reverse('recipe:recipe-export')
+IMPORT_URL = reverse('recipe:recipe-import-recipes')
+PANTRY_URL = reverse('recipe:recipe-pantry')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+CACHE_STATS_URL = reverse('recipe:cache-stats')
+STATS_URL = reverse('recipe:stats')
 
 
 def image_upload_url(recipe_id):
@@ -35,6 +59,11 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 def create_recipe(user, **params):
     """Create and return a sample recipe."""
     defaults = {
@@ -49,6 +78,12 @@ def create_recipe(user, **params):
     return recipe
 
 
+def build_similar_recipes():
+    """Build the stale lists of similar recipes."""
+    while RecipeSimilarity.objects.build_next():
+        pass
+
+
 def create_user(**params):
     """Helper function to create new user"""
     return get_user_model().objects.create_user(**params)
@@ -66,6 +101,12 @@ class PublicRecipeAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_export_auth_required(self):
+        """Test auth is required to export recipes."""
+        res = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class PrivateRecipeApiTests(TestCase):
     """Test authenticated API requests."""
@@ -88,7 +129,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
@@ -101,10 +142,10 @@ class PrivateRecipeApiTests(TestCase):
 
         res = self.client.get(RECIPES_URL)
 
-        self.assertEqual(len(res.data), 1)
-        self.assertNotIn(recipe1, res.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertNotIn(recipe1, res.data['results'])
         self.assertEqual(
-            res.data,
+            res.data['results'],
             RecipeSerializer([recipe2], many=True).data
         )
 
@@ -403,9 +444,9 @@ class PrivateRecipeApiTests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -424,9 +465,341 @@ class PrivateRecipeApiTests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_several_tags_returns_recipe_once(self):
+        """Test a recipe matching many filtered tags is listed once."""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        recipe.tags.add(tag1, tag2)
+
+        params = {'tags': f'{tag1.id},{tag2.id}'}
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [recipe.id])
+        sql = ' '.join(q['sql'] for q in queries.captured_queries).upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_filter_by_all_ingredients(self):
+        """Test filtering recipes containing every given ingredient."""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        milk = Ingredient.objects.create(user=self.user, name='Milk')
+        omelette = create_recipe(user=self.user, title='Omelette')
+        omelette.ingredients.add(salt, eggs, milk)
+        boiled = create_recipe(user=self.user, title='Boiled eggs')
+        boiled.ingredients.add(salt, eggs)
+        custard = create_recipe(user=self.user, title='Custard')
+        custard.ingredients.add(eggs, milk)
+
+        params = {'ingredients_all': f'{salt.id},{eggs.id},{eggs.id}'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [boiled.id, omelette.id])
+
+    def test_filter_excluding_tags_and_ingredients(self):
+        """Test leaving out recipes with any of the given objects."""
+        meat = Tag.objects.create(user=self.user, name='Meat')
+        nuts = Ingredient.objects.create(user=self.user, name='Nuts')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        stew = create_recipe(user=self.user, title='Stew')
+        stew.tags.add(meat)
+        cake = create_recipe(user=self.user, title='Cake')
+        cake.ingredients.add(nuts, salt)
+        soup = create_recipe(user=self.user, title='Soup')
+        soup.ingredients.add(salt)
+        bread = create_recipe(user=self.user, title='Bread')
+
+        params = {'tags_exclude': str(meat.id),
+                  'ingredients_exclude': str(nuts.id)}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [bread.id, soup.id])
+
+    def test_filter_all_and_exclude_combined(self):
+        """Test all-of and exclusion filters in a single query."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        nuts = Ingredient.objects.create(user=self.user, name='Nuts')
+        salad = create_recipe(user=self.user, title='Salad')
+        salad.tags.add(vegan, quick)
+        granola = create_recipe(user=self.user, title='Granola')
+        granola.tags.add(vegan, quick)
+        granola.ingredients.add(nuts)
+        get_user_model().objects.bump_revision(self.user)
+
+        params = {'tags_all': f'{vegan.id},{quick.id}',
+                  'ingredients_exclude': str(nuts.id)}
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data['results']], [salad.id])
+        sql = queries.captured_queries[1]['sql'].upper()
+        self.assertIn('HAVING', sql)
+        self.assertIn('NOT EXISTS', sql)
+
+    def test_list_query_count_independent_of_recipe_count(self):
+        """Test listing recipes doesn't issue queries per recipe."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+
+        def add_recipes(count):
+            for _ in range(count):
+                recipe = create_recipe(user=self.user)
+                recipe.tags.add(tag)
+                recipe.ingredients.add(ingredient)
+            get_user_model().objects.bump_revision(self.user)
+
+        add_recipes(1)
+        with self.assertNumQueries(5):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 1)
+
+        add_recipes(10)
+        with self.assertNumQueries(5):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data['results']), 11)
+        self.assertEqual(
+            res.data['results'][0]['tags'],
+            [{'id': tag.id, 'name': 'Dinner'}],
+        )
+
+    def test_detail_prefetches_tags_and_ingredients(self):
+        """Test recipe detail loads nested objects in bulk."""
+        recipe = create_recipe(user=self.user)
+        for name in ['Dinner', 'Lunch', 'Vegan']:
+            recipe.tags.add(Tag.objects.create(user=self.user, name=name))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=name)
+            )
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 3)
+        self.assertEqual(len(res.data['ingredients']), 3)
+
+    def test_list_paginated_by_cursor(self):
+        """Test recipes are paginated newest first with opaque cursors."""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertIsNone(res.data['previous'])
+        self.assertEqual(
+            [r['id'] for r in res.data['results']],
+            [recipes[4].id, recipes[3].id],
+        )
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(
+            [r['id'] for r in res.data['results']],
+            [recipes[2].id, recipes[1].id],
+        )
+        self.assertIsNotNone(res.data['previous'])
+
+    def test_list_pages_have_constant_query_count(self):
+        """Test later pages don't count or scan earlier rows."""
+        for _ in range(6):
+            create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(res.data['next'])
+
+        sql = ' '.join(q['sql'] for q in queries.captured_queries).upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_filter_by_time_and_price_ranges(self):
+        """Test filtering recipes by bounds on time and price."""
+        quick_cheap = create_recipe(user=self.user, time_minutes=20,
+                                    price=Decimal('8.00'))
+        create_recipe(user=self.user, time_minutes=45, price=Decimal('6.00'))
+        create_recipe(user=self.user, time_minutes=15, price=Decimal('12.50'))
+        create_recipe(user=self.user, time_minutes=5, price=Decimal('1.00'))
+
+        res = self.client.get(RECIPES_URL, {
+            'min_time': 10, 'max_time': 30, 'max_price': '10',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [quick_cheap.id])
+
+    def test_filter_by_invalid_range_error(self):
+        """Test malformed bounds are rejected."""
+        res = self.client.get(RECIPES_URL, {'max_price': 'cheap'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('max_price', res.data)
+
+    def test_order_by_fields(self):
+        """Test ordering recipes by time, price and title."""
+        soup = create_recipe(user=self.user, title='Soup', time_minutes=30,
+                             price=Decimal('4.00'))
+        cake = create_recipe(user=self.user, title='Cake', time_minutes=60,
+                             price=Decimal('3.00'))
+        salad = create_recipe(user=self.user, title='Salad',
+                              time_minutes=10, price=Decimal('6.00'))
+
+        orderings = {
+            'time_minutes': [salad, soup, cake],
+            '-time_minutes': [cake, soup, salad],
+            'price': [cake, soup, salad],
+            'title': [cake, salad, soup],
+            '-title': [soup, salad, cake],
+        }
+        for ordering, expected in orderings.items():
+            res = self.client.get(RECIPES_URL, {'ordering': ordering})
+
+            self.assertEqual([r['id'] for r in res.data['results']],
+                             [recipe.id for recipe in expected], ordering)
+
+    def test_invalid_ordering_error(self):
+        """Test an unknown ordering is rejected."""
+        res = self.client.get(RECIPES_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordered_pages_follow_ties_both_ways(self):
+        """Test cursors page through equal values without gaps."""
+        prices = ['2.00', '5.00', '5.00', '5.00', '5.00', '9.00']
+        ids = [create_recipe(user=self.user, price=Decimal(price)).id
+               for price in prices]
+        params = {'ordering': 'price', 'page_size': 2, 'max_price': '8'}
+
+        res = self.client.get(RECIPES_URL, params)
+        pages = [[r['id'] for r in res.data['results']]]
+        while res.data['next']:
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(res.data['next'])
+            pages.append([r['id'] for r in res.data['results']])
+            sql = ' '.join(q['sql'] for q in queries.captured_queries)
+            self.assertNotIn('OFFSET', sql.upper())
+
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:5]])
+        res = self.client.get(res.data['previous'])
+        self.assertEqual([r['id'] for r in res.data['results']], ids[2:4])
+
+    def test_invalid_cursor_not_found(self):
+        """Test cursors not matching the ordering are rejected."""
+        for _ in range(3):
+            create_recipe(user=self.user)
+        reuses = [
+            (None, 'price'),
+            ('time_minutes', 'price'),
+            ('time_minutes', '-time_minutes'),
+            ('price', 'title'),
+            ('-title', 'title'),
+        ]
+
+        for ordering, other in reuses:
+            params = {'page_size': 2}
+            if ordering:
+                params['ordering'] = ordering
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            res = self.client.get(res.data['next'] + f'&ordering={other}')
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND,
+                             (ordering, other))
+
+    def test_create_recipe_query_count_independent_of_nested_items(self):
+        """Test nested tags and ingredients are written in batches."""
+        def payload(count):
+            return {
+                'title': 'Sample recipe',
+                'time_minutes': 30,
+                'price': Decimal('5.99'),
+                'tags': [{'name': f'Tag {i}'} for i in range(count)],
+                'ingredients': [
+                    {'name': f'Ingredient {i}'} for i in range(count)
+                ],
+            }
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(RECIPES_URL, payload(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.post(RECIPES_URL, payload(20), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(small), len(large))
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 20)
+        self.assertEqual(recipe.ingredients.count(), 20)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 20)
+
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test repeated names in the payload create a single tag."""
+        payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 30,
+            'price': Decimal('5.99'),
+            'tags': [{'name': 'Vegan'}, {'name': 'Vegan'}],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_noop_update_does_not_write_links(self):
+        """Test patching unchanged tags and ingredients skips M2M writes."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt')
+        )
+
+        payload = {
+            'tags': [{'name': 'Vegan'}],
+            'ingredients': [{'name': 'Salt'}],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith(('INSERT', 'UPDATE', 'DELETE')):
+                self.assertNotIn('core_recipe_tags', sql)
+                self.assertNotIn('core_recipe_ingredients', sql)
+
+    def test_update_only_changes_differing_links(self):
+        """Test links kept across an update are not rewritten."""
+        recipe = create_recipe(user=self.user)
+        tag_keep = Tag.objects.create(user=self.user, name='Vegan')
+        tag_drop = Tag.objects.create(user=self.user, name='Dinner')
+        recipe.tags.add(tag_keep, tag_drop)
+        through = Recipe.tags.through
+        kept_link = through.objects.get(recipe=recipe, tag=tag_keep)
+
+        payload = {'tags': [{'name': 'Vegan'}, {'name': 'Lunch'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)),
+            {'Vegan', 'Lunch'},
+        )
+        self.assertTrue(through.objects.filter(id=kept_link.id).exists())
 
 
 class ImageUploadTests(TestCase):
@@ -442,8 +815,23 @@ class ImageUploadTests(TestCase):
         self.recipe = create_recipe(user=self.user)
 
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        for name in self.recipe.image_renditions.values():
+            self.recipe.image.storage.delete(name)
         self.recipe.image.delete()
 
+    def _upload(self, size=(10, 10), recipe=None, **save_params):
+        """Upload a JPEG image of the given size to the recipe."""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', size)
+            img.save(ntf, format='JPEG', **save_params)
+            ntf.seek(0)
+            return self.client.post(
+                image_upload_url((recipe or self.recipe).id),
+                {'image': ntf},
+                format='multipart',
+            )
+
     def test_upload_image(self):
         """Test uploading an image to a recipe."""
         url = image_upload_url(self.recipe.id)
@@ -458,9 +846,1200 @@ class ImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_queues_renditions(self):
+        """Test uploading an image queues its renditions."""
+        res = self._upload()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.data['renditions'], {})
+        job = RecipeImageJob.objects.get(recipe=self.recipe)
+        self.assertEqual(job.image, self.recipe.image.name)
+
+    def test_upload_same_image_shares_file(self):
+        """Test identical uploads to two recipes share one stored file."""
+        other = create_recipe(user=self.user)
+        self._upload()
+        res = self._upload(recipe=other)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        blob = ImageBlob.objects.get(name=self.recipe.image.name)
+        self.assertEqual(blob.references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.references, 1)
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+
+    def test_replace_image_deletes_previous(self):
+        """Test replacing an image deletes the unreferenced previous one."""
+        self._upload()
+        self.recipe.refresh_from_db()
+        previous = self.recipe.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._upload(size=(20, 20))
+
+        self.recipe.refresh_from_db()
+        self.assertNotEqual(self.recipe.image.path, previous)
+        self.assertFalse(os.path.exists(previous))
+        self.assertFalse(ImageBlob.objects.filter(
+            name__endswith=os.path.basename(previous)).exists())
+
+    def test_process_image_job(self):
+        """Test renditions are resized, stripped and listed by the API."""
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera maker'
+        self._upload(size=(1200, 900), exif=exif.tobytes())
+
+        self.assertTrue(process_next_job())
+
+        self.recipe.refresh_from_db()
+        self.assertFalse(RecipeImageJob.objects.exists())
+        storage = self.recipe.image.storage
+        with storage.open(self.recipe.image_renditions['thumbnail']) as f:
+            with Image.open(f) as thumbnail:
+                self.assertEqual(thumbnail.size, (200, 150))
+                self.assertEqual(len(thumbnail.getexif()), 0)
+        with storage.open(self.recipe.image_renditions['medium']) as f:
+            with Image.open(f) as medium:
+                self.assertEqual(medium.size, (800, 600))
+
+        thumbnail_url = (
+            'http://testserver'
+            + storage.url(self.recipe.image_renditions['thumbnail'])
+        )
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['renditions']['thumbnail'], thumbnail_url)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data['results'][0]['thumbnail'], thumbnail_url)
+
+    def test_replace_image_drops_previous_renditions(self):
+        """Test a new image isn't served with the previous renditions."""
+        self._upload()
+        process_next_job()
+        self.recipe.refresh_from_db()
+        previous = list(self.recipe.image_renditions.values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self._upload(size=(20, 20))
+
+        self.assertEqual(res.data['renditions'], {})
+        res = self.client.get(RECIPES_URL)
+        self.assertIsNone(res.data['results'][0]['thumbnail'])
+        storage = self.recipe.image.storage
+        for name in previous:
+            self.assertFalse(storage.exists(name))
+            self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_image_replaced_while_processed(self):
+        """Test renditions of an image replaced meanwhile are dropped."""
+        self._upload()
+        made = []
+
+        def replace_image(image_file):
+            renditions = make_renditions(image_file)
+            made.extend(renditions.values())
+            self._upload(size=(20, 20))
+            return renditions
+
+        with patch('recipe.images.make_renditions', replace_image), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(process_next_job())
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_renditions, {})
+        job = RecipeImageJob.objects.get()
+        self.assertEqual(job.image, self.recipe.image.name)
+        storage = self.recipe.image.storage
+        for name in made:
+            self.assertFalse(storage.exists(name))
+        self.assertTrue(process_next_job())
+        self.recipe.refresh_from_db()
+        self.assertIn('thumbnail', self.recipe.image_renditions)
+
+    def test_process_image_job_unreadable_image(self):
+        """Test failing jobs record the error and are retried."""
+        self._upload()
+        with self.recipe.image.storage.open(
+                RecipeImageJob.objects.get().image, 'wb') as f:
+            f.write(b'not an image')
+
+        self.assertTrue(process_next_job())
+
+        job = RecipeImageJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.error)
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_upload_image_too_large(self):
+        """Test uploads over the size limit are rejected while streamed."""
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.effect_noise((100, 100), 50).save(ntf, format='PNG')
+            ntf.seek(0)
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=99)
+    def test_upload_image_too_many_pixels(self):
+        """Test images with too many pixels are rejected from the header."""
+        res = self._upload(size=(10, 10))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['image'],
+                         ['Image dimensions are too large.'])
+
+    def test_upload_not_an_image(self):
+        """Test uploading a file that isn't an image fails."""
+        res = self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': SimpleUploadedFile('notes.jpg', b'not an image')},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['image'], ['Upload a valid image.'])
+
+    def test_upload_handler_hashes_content(self):
+        """Test the upload handler hashes the file while it's written."""
+        content = io.BytesIO()
+        Image.new('RGB', (50, 50)).save(content, format='PNG')
+        content = content.getvalue()
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'image.png', 'image/png', len(content))
+
+        for start in range(0, len(content), 16):
+            handler.receive_data_chunk(content[start:start + 16], start)
+        uploaded = handler.file_complete(len(content))
+
+        self.assertEqual(uploaded.content_hash,
+                         hashlib.sha256(content).hexdigest())
+        self.assertEqual(uploaded.image_size, (50, 50))
+        self.assertEqual(uploaded.read(), content)
+        uploaded.close()
+
     def test_upload_image_bad_request(self):
         """Test uploading invalid image."""
         url = image_upload_url(self.recipe.id)
         res = self.client.post(url, {'image': 'notimage'}, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkRecipeApiTests(TestCase):
+    """Tests for the bulk recipe API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, count, **params):
+        """Return a list of recipe payloads sharing tags and ingredients."""
+        payload = []
+        for i in range(count):
+            item = {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '2.50',
+                'tags': [{'name': 'Dinner'}, {'name': f'Tag {i}'}],
+                'ingredients': [{'name': 'Salt'}],
+            }
+            item.update(params)
+            payload.append(item)
+        return payload
+
+    def test_bulk_create(self):
+        """Test creating many recipes in one request."""
+        Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.post(BULK_URL, self._payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item['title'] for item in res.data],
+            ['Recipe 0', 'Recipe 1', 'Recipe 2'],
+        )
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+
+    def test_bulk_create_query_count_independent_of_batch_size(self):
+        """Test the number of queries doesn't grow with the batch."""
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(BULK_URL, self._payload(2), format='json')
+        payload = self._payload(20, ingredients=[{'name': 'Pepper'}])
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_create_invalid_item_creates_nothing(self):
+        """Test a single invalid item rejects the whole batch."""
+        payload = self._payload(3)
+        del payload[1]['title']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_create_requires_list(self):
+        """Test the bulk endpoint rejects a single object."""
+        res = self.client.post(BULK_URL, self._payload(1)[0], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_partial_update(self):
+        """Test partially updating many recipes in one request."""
+        r1 = create_recipe(user=self.user, title='Curry')
+        r2 = create_recipe(user=self.user, title='Soup')
+        r2.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+
+        payload = [
+            {'id': r2.id, 'tags': [{'name': 'Lunch'}]},
+            {'id': r1.id, 'title': 'Green curry'},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [r2.id, r1.id])
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.title, 'Green curry')
+        self.assertEqual(r2.title, 'Soup')
+        self.assertEqual(
+            list(r2.tags.values_list('name', flat=True)),
+            ['Lunch'],
+        )
+
+    def test_bulk_partial_update_other_users_recipe_error(self):
+        """Test bulk updates can't touch another user's recipes."""
+        other_user = create_user(email='other@example.com', password='pw123')
+        own = create_recipe(user=self.user, title='Curry')
+        other = create_recipe(user=other_user, title='Soup')
+
+        payload = [
+            {'id': own.id, 'title': 'Changed'},
+            {'id': other.id, 'title': 'Changed'},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        own.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(own.title, 'Curry')
+        self.assertEqual(other.title, 'Soup')
+
+    def test_bulk_partial_update_boolean_id_error(self):
+        """Test a boolean is not read as a recipe id."""
+        recipe = create_recipe(user=self.user, title='Curry', id=1)
+
+        payload = [{'id': True, 'title': 'Changed'}]
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', res.data[0])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Curry')
+
+    def test_bulk_delete(self):
+        """Test deleting many recipes by id."""
+        other_user = create_user(email='other@example.com', password='pw123')
+        r1 = create_recipe(user=self.user)
+        r2 = create_recipe(user=self.user)
+        other = create_recipe(user=other_user)
+
+        payload = {'ids': [r1.id, other.id, r2.id]}
+        res = self.client.delete(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], [r1.id, r2.id])
+        self.assertEqual(res.data['not_found'], [other.id])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertTrue(Recipe.objects.filter(id=other.id).exists())
+
+
+class RecipeExportApiTests(TestCase):
+    """Tests for streaming recipe exports."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _content(self, res):
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Test exporting recipes as newline delimited JSON."""
+        recipe = create_recipe(user=self.user, title='Curry')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Dinner'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice')
+        )
+        create_recipe(user=self.user, title='Soup')
+        create_recipe(
+            user=create_user(email='other@example.com', password='pw123'),
+        )
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('application/x-ndjson'))
+        rows = [json.loads(line) for line in self._content(res).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Soup', 'Curry'])
+        self.assertEqual(rows[1]['tags'], ['Dinner'])
+        self.assertEqual(rows[1]['ingredients'], ['Rice'])
+        self.assertEqual(rows[1]['price'], '5.25')
+
+    def test_export_csv(self):
+        """Test exporting recipes as CSV."""
+        recipe = create_recipe(user=self.user, title='Curry')
+        for name in ['Dinner', 'Vegan']:
+            recipe.tags.add(Tag.objects.create(user=self.user, name=name))
+
+        res = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(self._content(res))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Curry')
+        self.assertEqual(rows[0]['tags'], 'Dinner|Vegan')
+        self.assertEqual(rows[0]['ingredients'], '')
+
+    def test_export_respects_filters(self):
+        """Test the export applies the tag filter."""
+        r1 = create_recipe(user=self.user, title='Curry')
+        create_recipe(user=self.user, title='Soup')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        r1.tags.add(tag)
+
+        res = self.client.get(EXPORT_URL, {'tags': str(tag.id)})
+
+        rows = [json.loads(line) for line in self._content(res).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Curry'])
+
+    @patch('recipe.exports.CHUNK_SIZE', 2)
+    def test_export_fetches_relations_per_chunk(self):
+        """Test tags and ingredients are loaded once per chunk."""
+        for i in range(5):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(EXPORT_URL)
+        with CaptureQueriesContext(connection) as queries:
+            content = self._content(res)
+
+        self.assertEqual(len(content.splitlines()), 5)
+        relation_queries = [
+            q for q in queries.captured_queries
+            if 'core_recipe_tags' in q['sql']
+        ]
+        self.assertEqual(len(relation_queries), 3)
+
+
+class RecipeImportApiTests(TestCase):
+    """Tests for streaming recipe imports."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _upload(self, name, content):
+        upload = io.BytesIO(content.encode())
+        upload.name = name
+        return self.client.post(IMPORT_URL, {'file': upload},
+                                format='multipart')
+
+    def test_import_ndjson(self):
+        """Test importing recipes from newline delimited JSON."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        lines = [
+            {'title': 'Curry', 'time_minutes': 30, 'price': '4.50',
+             'tags': ['Dinner', 'Spicy'], 'ingredients': ['Rice']},
+            {'title': 'Soup', 'time_minutes': 10, 'price': '2.00',
+             'tags': [{'name': 'Dinner'}]},
+        ]
+        content = ''.join(json.dumps(line) + '\n' for line in lines)
+
+        res = self._upload('recipes.ndjson', content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 2)
+        self.assertEqual(res.data['failed'], 0)
+        curry = Recipe.objects.get(user=self.user, title='Curry')
+        self.assertEqual(
+            set(curry.tags.values_list('name', flat=True)),
+            {'Dinner', 'Spicy'},
+        )
+        self.assertEqual(curry.price, Decimal('4.50'))
+        soup = Recipe.objects.get(user=self.user, title='Soup')
+        self.assertEqual(list(soup.tags.all()), [tag])
+
+    def test_import_reports_invalid_rows(self):
+        """Test invalid rows are skipped and reported by row number."""
+        content = '\n'.join([
+            json.dumps({'title': 'Curry', 'time_minutes': 30,
+                        'price': '4.50'}),
+            json.dumps({'title': 'No time', 'price': '1.00'}),
+            'not json',
+        ])
+
+        res = self._upload('recipes.ndjson', content)
+
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(res.data['failed'], 2)
+        self.assertEqual([e['row'] for e in res.data['errors']], [2, 3])
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+
+    def test_import_csv_from_export(self):
+        """Test a CSV export can be imported into another library."""
+        other_user = create_user(email='other@example.com', password='pw123')
+        recipe = create_recipe(user=other_user, title='Curry')
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=other_user, name='Rice')
+        )
+        self.client.force_authenticate(other_user)
+        export = self.client.get(EXPORT_URL, {'format': 'csv'})
+        content = b''.join(export.streaming_content).decode()
+        self.client.force_authenticate(self.user)
+
+        res = self._upload('recipes.csv', content)
+
+        self.assertEqual(res.data['imported'], 1)
+        imported = Recipe.objects.get(user=self.user)
+        self.assertEqual(imported.title, 'Curry')
+        self.assertEqual(imported.ingredients.get().user, self.user)
+
+    def test_import_rejects_names_not_in_a_list(self):
+        """Test tags and ingredients other than lists are invalid rows."""
+        content = '\n'.join(json.dumps({
+            'title': 'Curry', 'time_minutes': 30, 'price': '4.50', **extra,
+        }) for extra in ({'tags': 'Vegan'}, {'ingredients': 5},
+                         {'tags': None}))
+
+        res = self._upload('recipes.ndjson', content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual([e['row'] for e in res.data['errors']], [1, 2])
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+
+    def test_import_unreadable_file_error(self):
+        """Test files that aren't UTF-8 text are rejected."""
+        upload = io.BytesIO(b'{"title": "Caf\xe9"}\n')
+        upload.name = 'recipes.ndjson'
+
+        res = self.client.post(IMPORT_URL, {'file': upload},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', res.data)
+        self.assertEqual(res.data['imported'], 0)
+
+    def test_import_requires_file(self):
+        """Test the import endpoint requires a file."""
+        res = self.client.post(IMPORT_URL, {}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConditionalRecipeApiTests(TestCase):
+    """Tests for conditional requests on the recipe API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_list_not_modified(self):
+        """Test an unchanged list is answered with a bare 304."""
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_list_etag_changes_after_write(self):
+        """Test writes through the API change the list ETag."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        self.client.post(RECIPES_URL, {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': '1.00',
+        }, format='json')
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_detail_not_modified(self):
+        """Test an unchanged detail is answered without loading links."""
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                detail_url(self.recipe.id),
+                HTTP_IF_NONE_MATCH=res['ETag'],
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_update_with_stale_etag_fails(self):
+        """Test an update conditioned on an old version is refused."""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        self.client.patch(BULK_URL, [
+            {'id': self.recipe.id, 'tags': [{'name': 'Dinner'}]},
+        ], format='json')
+
+        res = self.client.patch(
+            detail_url(self.recipe.id),
+            {'title': 'Lost update'},
+            HTTP_IF_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Sample recipe title')
+
+    def test_update_with_current_etag(self):
+        """Test an update conditioned on the current version succeeds."""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        res = self.client.patch(
+            detail_url(self.recipe.id),
+            {'title': 'New title'},
+            HTTP_IF_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class CachedRecipeListTests(TestCase):
+    """Tests for the recipe list response cache."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+        create_recipe(user=self.user)
+
+    def test_list_served_from_cache(self):
+        """Test a repeated list only reads the user's revision."""
+        res = self.client.get(RECIPES_URL, {'page_size': 5, 'tags': ''})
+        hits = get_metrics()['hits']
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                RECIPES_URL, {'tags': '', 'page_size': 5})
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(get_metrics()['hits'], hits + 1)
+
+    def test_write_invalidates_cached_list(self):
+        """Test writes through the API are visible in the next list."""
+        self.client.get(RECIPES_URL)
+        recipe = Recipe.objects.get(user=self.user)
+
+        self.client.patch(detail_url(recipe.id), {'title': 'Renamed'})
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'][0]['title'], 'Renamed')
+
+    def test_cache_not_shared_between_users(self):
+        """Test cached lists are kept per user."""
+        self.client.get(RECIPES_URL)
+        other_user = create_user(email='other@example.com', password='pw123')
+        self.client.force_authenticate(other_user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_evictions_counted(self):
+        """Test the local memory backend counts evicted entries."""
+        cache = MeteredLocMemCache('test-evictions', {
+            'OPTIONS': {'MAX_ENTRIES': 2, 'CULL_FREQUENCY': 2},
+        })
+        evictions = get_metrics()['evictions']
+
+        for i in range(3):
+            cache.set(f'key-{i}', i)
+
+        self.assertEqual(get_metrics()['evictions'], evictions + 1)
+        self.assertIsNone(cache.get('key-0'))
+        self.assertEqual(cache.get('key-2'), 2)
+
+    def test_cache_stats_requires_staff(self):
+        """Test cache metrics are only reported to staff users."""
+        res = self.client.get(CACHE_STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['backend'], 'MeteredLocMemCache')
+        self.assertIn('evictions', res.data)
+
+    def test_metrics_kept_in_shared_cache(self):
+        """Test metrics are counted in the cache every worker reads."""
+        # Another client of the same store, as another worker would have.
+        shared = LocMemCache('metrics', {})
+        self.client.get(RECIPES_URL)
+        hits = get_metrics()['hits']
+
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(shared.get('list-cache:hits'), hits + 1)
+
+
+class RecipeSearchApiTests(TestCase):
+    """Test full-text search of recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def _create(self, **payload):
+        """Create a recipe through the API and return its id."""
+        payload = {'time_minutes': 10, 'price': Decimal('2.50'), **payload}
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def _search(self, text, **params):
+        """Return the ids of the recipes matching a search."""
+        res = self.client.get(RECIPES_URL, {'search': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_title_description_tags_and_ingredients(self):
+        """Test every indexed field is searched, with stemming."""
+        curry = self._create(title='Thai curry',
+                             tags=[{'name': 'Spicy'}],
+                             ingredients=[{'name': 'Coconut milk'}])
+        soup = self._create(title='Soup', description='Slowly simmered')
+        other_user = create_user(email='other@example.com', password='x')
+        create_recipe(user=other_user, title='Thai curry')
+        Recipe.objects.update_search_vectors(
+            Recipe.objects.filter(user=other_user).values('id'))
+
+        self.assertEqual(self._search('curries'), [curry])
+        self.assertEqual(self._search('spicy'), [curry])
+        self.assertEqual(self._search('coconut'), [curry])
+        self.assertEqual(self._search('simmer'), [soup])
+        self.assertEqual(self._search('pizza'), [])
+
+    def test_search_ranks_title_matches_first(self):
+        """Test matches in titles rank above tags and descriptions."""
+        in_description = self._create(title='Stew',
+                                      description='Uses a lot of garlic')
+        in_title = self._create(title='Garlic bread')
+        in_tag = self._create(title='Pasta', tags=[{'name': 'Garlic'}])
+
+        self.assertEqual(self._search('garlic'),
+                         [in_title, in_tag, in_description])
+
+    def test_search_paginates_ranked_results(self):
+        """Test ranked results are paged with cursors."""
+        ids = [self._create(title=f'Soup {i}') for i in range(3)]
+
+        res = self.client.get(RECIPES_URL, {'search': 'soup', 'page_size': 2})
+        page = [recipe['id'] for recipe in res.data['results']]
+        res = self.client.get(res.data['next'])
+        page += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(page, ids[::-1])
+        self.assertIsNone(res.data['next'])
+
+    def test_search_follows_updates(self):
+        """Test recipe, tag and ingredient edits are searchable."""
+        recipe_id = self._create(title='Soup', tags=[{'name': 'Cold'}])
+        tag = Tag.objects.get(user=self.user, name='Cold')
+
+        self.client.patch(detail_url(recipe_id), {'title': 'Gazpacho'})
+        self.assertEqual(self._search('gazpacho'), [recipe_id])
+        self.assertEqual(self._search('soup'), [])
+
+        self.client.patch(reverse('recipe:tag-detail', args=[tag.id]),
+                          {'name': 'Chilled'})
+        self.assertEqual(self._search('chilled'), [recipe_id])
+
+        self.client.delete(reverse('recipe:tag-detail', args=[tag.id]))
+        self.assertEqual(self._search('chilled'), [])
+
+        self.client.patch(detail_url(recipe_id),
+                          {'ingredients': [{'name': 'Tomato'}]},
+                          format='json')
+        self.assertEqual(self._search('tomatoes'), [recipe_id])
+
+    def test_bulk_writes_are_searchable(self):
+        """Test recipes created and updated in bulk are indexed."""
+        res = self.client.post(BULK_URL, [
+            {'title': 'Bulk soup', 'time_minutes': 5, 'price': '1.00'},
+        ], format='json')
+        recipe_id = res.data[0]['id']
+        self.assertEqual(self._search('soup'), [recipe_id])
+
+        self.client.patch(BULK_URL, [
+            {'id': recipe_id, 'tags': [{'name': 'Winter'}]},
+        ], format='json')
+        self.assertEqual(self._search('winter'), [recipe_id])
+
+
+class RecipePantryApiTests(TestCase):
+    """Test ranking recipes by the ingredients on hand."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def _create(self, title, ingredients):
+        """Create a recipe through the API and return its id."""
+        res = self.client.post(RECIPES_URL, {
+            'title': title,
+            'time_minutes': 10,
+            'price': Decimal('2.50'),
+            'ingredients': [{'name': name} for name in ingredients],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def _ids(self, *names):
+        return [Ingredient.objects.get(user=self.user, name=name).id
+                for name in names]
+
+    def test_pantry_ranks_by_coverage(self):
+        """Test recipes are ranked by the share of ingredients on hand."""
+        omelette = self._create('Omelette', ['Egg', 'Butter'])
+        bread = self._create('Bread', ['Flour', 'Salt', 'Yeast'])
+        cake = self._create('Cake', ['Flour', 'Egg', 'Butter', 'Sugar'])
+        self._create('Salad', ['Lettuce'])
+
+        res = self.client.post(PANTRY_URL, {
+            'ingredients': self._ids('Egg', 'Butter', 'Flour'),
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(match['id'], match['coverage']) for match in res.data],
+            [(omelette, 1.0), (cake, 0.75), (bread, 1 / 3)],
+        )
+        self.assertEqual(res.data[0]['missing'], [])
+        self.assertEqual(res.data[1]['missing'], [
+            {'id': self._ids('Sugar')[0], 'name': 'Sugar'},
+        ])
+        self.assertEqual(
+            [ingredient['name'] for ingredient in res.data[2]['missing']],
+            ['Salt', 'Yeast'],
+        )
+
+    def test_pantry_limit(self):
+        """Test at most `limit` recipes are returned, in few queries."""
+        for i in range(3):
+            self._create(f'Toast {i}', ['Bread'])
+        pantry = self._ids('Bread')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(PANTRY_URL, {
+                'ingredients': pantry,
+                'limit': 2,
+            }, format='json')
+
+        self.assertEqual(len(res.data), 2)
+        self.assertEqual(len(queries), 4)
+
+    def test_pantry_ignores_other_users_ingredients(self):
+        """Test ingredients of other users match none of their recipes."""
+        other_user = create_user(email='other@example.com', password='x')
+        egg = Ingredient.objects.create(user=other_user, name='Egg')
+        recipe = create_recipe(user=other_user)
+        recipe.ingredients.add(egg)
+
+        res = self.client.post(PANTRY_URL, {'ingredients': [egg.id]},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_pantry_requires_ingredients(self):
+        """Test an empty pantry is rejected."""
+        res = self.client.post(PANTRY_URL, {'ingredients': []},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SimilarRecipeApiTests(TestCase):
+    """Test listing recipes similar to a recipe."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def _create(self, title, tags=(), ingredients=()):
+        """Create a recipe through the API and return its id."""
+        res = self.client.post(RECIPES_URL, {
+            'title': title,
+            'time_minutes': 10,
+            'price': Decimal('2.50'),
+            'tags': [{'name': name} for name in tags],
+            'ingredients': [{'name': name} for name in ingredients],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.data['id']
+
+    def test_similar_recipes(self):
+        """Test recipes sharing tags and ingredients are listed, best first."""
+        curry = self._create('Curry', ['Spicy'], ['Rice', 'Chicken'])
+        paella = self._create('Paella', [], ['Rice', 'Chicken', 'Prawn'])
+        chili = self._create('Chili', ['Spicy'], ['Beans'])
+        self._create('Cake', ['Sweet'], ['Flour'])
+        other_user = create_user(email='other@example.com', password='x')
+        copy = create_recipe(user=other_user, title='Curry')
+        copy.ingredients.add(*Ingredient.objects.filter(user=self.user))
+        build_similar_recipes()
+
+        res = self.client.get(similar_url(curry))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(recipe['id'], recipe['similarity']) for recipe in res.data],
+            [(paella, 0.5), (chili, 0.25)],
+        )
+        self.assertEqual(
+            {ingredient['name'] for ingredient in res.data[0]['ingredients']},
+            {'Rice', 'Chicken', 'Prawn'},
+        )
+        res = self.client.get(similar_url(curry), {'limit': 1})
+        self.assertEqual([recipe['id'] for recipe in res.data], [paella])
+
+    def test_similar_recipes_follow_updates(self):
+        """Test lists are served until rebuilt after links change."""
+        curry = self._create('Curry', [], ['Rice', 'Chicken'])
+        paella = self._create('Paella', [], ['Rice', 'Prawn'])
+        build_similar_recipes()
+
+        self.client.patch(detail_url(paella), {
+            'ingredients': [{'name': 'Rice'}, {'name': 'Chicken'}],
+        }, format='json')
+        res = self.client.get(similar_url(curry))
+        self.assertAlmostEqual(res.data[0]['similarity'], 1 / 3)
+        build_similar_recipes()
+        res = self.client.get(similar_url(curry))
+
+        self.assertEqual(res.data[0]['similarity'], 1.0)
+
+    def test_similar_recipes_not_built(self):
+        """Test a recipe without a list has none until it is built."""
+        curry = self._create('Curry', [], ['Rice'])
+        self._create('Paella', [], ['Rice'])
+        RecipeSimilarity.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(similar_url(curry))
+
+        self.assertEqual(res.data, [])
+        self.assertNotIn('recipe_tags', ' '.join(
+            query['sql'] for query in queries.captured_queries))
+        build_similar_recipes()
+        res = self.client.get(similar_url(curry))
+        self.assertEqual(len(res.data), 1)
+
+    def test_similar_recipes_of_other_user_not_found(self):
+        """Test only the user's own recipes have similar recipes."""
+        other_user = create_user(email='other@example.com', password='x')
+        recipe = create_recipe(user=other_user)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ShoppingListApiTests(TestCase):
+    """Test aggregating the ingredients of many recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def _create(self, title, ingredients):
+        """Create a recipe with the named ingredients and return it."""
+        recipe = create_recipe(user=self.user, title=title)
+        recipe.ingredients.add(*(
+            Ingredient.objects.get_or_create(user=self.user, name=name)[0]
+            for name in ingredients
+        ))
+        return recipe
+
+    def test_shopping_list(self):
+        """Test ingredients are listed once, counting their recipes."""
+        soup = self._create('Soup', ['Onion', 'Carrot', 'Stock'])
+        stew = self._create('Stew', ['Onion', 'Carrot', 'Beef'])
+        salad = self._create('Salad', ['Carrot', 'Lettuce'])
+        self._create('Cake', ['Flour'])
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(SHOPPING_LIST_URL, {
+                'recipes': [soup.id, stew.id, salad.id],
+            }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            [(item['name'], item['recipes']) for item in res.data],
+            [('Beef', 1), ('Carrot', 3), ('Lettuce', 1), ('Onion', 2),
+             ('Stock', 1)],
+        )
+        onion = Ingredient.objects.get(user=self.user, name='Onion')
+        self.assertEqual(res.data[3]['id'], onion.id)
+
+    def test_shopping_list_limited_to_user(self):
+        """Test recipes of other users are left out."""
+        soup = self._create('Soup', ['Onion'])
+        other_user = create_user(email='other@example.com', password='x')
+        other = create_recipe(user=other_user)
+        other.ingredients.add(
+            Ingredient.objects.create(user=other_user, name='Garlic'))
+
+        res = self.client.post(SHOPPING_LIST_URL, {
+            'recipes': [soup.id, other.id],
+        }, format='json')
+
+        self.assertEqual([item['name'] for item in res.data], ['Onion'])
+
+    def test_shopping_list_requires_recipes(self):
+        """Test an empty selection is rejected."""
+        res = self.client.post(SHOPPING_LIST_URL, {'recipes': []},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UserStatsApiTests(TestCase):
+    """Test the stats of the user's recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def test_stats(self):
+        """Test counters are read without scanning recipes."""
+        for title, minutes, tags in (('Soup', 10, ['Vegan', 'Quick']),
+                                     ('Stew', 50, ['Vegan']),
+                                     ('Salad', 3, [])):
+            self.client.post(RECIPES_URL, {
+                'title': title,
+                'time_minutes': minutes,
+                'price': '5.00',
+                'tags': [{'name': name} for name in tags],
+            }, format='json')
+        Tag.objects.create(user=self.user, name='Unused')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertEqual(res.data['average_time_minutes'], 21.0)
+        self.assertEqual(res.data['total_price'], '15.00')
+        self.assertEqual(res.data['average_price'], '5.00')
+        self.assertEqual(
+            [(tag['name'], tag['usage_count'])
+             for tag in res.data['top_tags']],
+            [('Vegan', 2), ('Quick', 1)],
+        )
+        self.assertEqual(res.data['top_ingredients'], [])
+
+    def test_stats_without_recipes(self):
+        """Test users without recipes get empty stats."""
+        self.user.stats.delete()
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['average_price'])
+
+
+class SparseFieldsetApiTests(TestCase):
+    """Test selecting the fields and nested relations of recipes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user, title='Curry')
+        self.tag = Tag.objects.create(user=self.user, name='Spicy')
+        self.ingredient = Ingredient.objects.create(user=self.user,
+                                                    name='Rice')
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def test_list_selected_fields(self):
+        """Test lists return and read only the fields asked for."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'],
+                         [{'id': self.recipe.id, 'title': 'Curry'}])
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('"core_recipe"."link"', sql)
+        self.assertNotIn('core_tag', sql)
+        self.assertNotIn('core_ingredient', sql)
+
+    def test_relations_not_expanded_list_ids(self):
+        """Test relations left out of expand are listed by id."""
+        res = self.client.get(RECIPES_URL, {
+            'fields': 'id,tags,ingredients',
+            'expand': 'ingredients',
+        })
+
+        recipe = res.data['results'][0]
+        self.assertEqual(recipe['tags'], [self.tag.id])
+        self.assertEqual(recipe['ingredients'],
+                         [{'id': self.ingredient.id, 'name': 'Rice'}])
+
+    def test_default_fieldset_unchanged(self):
+        """Test recipes without fields or expand are returned in full."""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.recipe.refresh_from_db()
+        serializer = RecipeDetailSerializer(self.recipe)
+        self.assertEqual(res.data, serializer.data)
+
+    def test_retrieve_selected_fields(self):
+        """Test details are sparse and tagged apart from the full one."""
+        url = detail_url(self.recipe.id)
+        full = self.client.get(url)
+
+        res = self.client.get(url, {'fields': 'title,thumbnail',
+                                    'expand': ''})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'title': 'Curry', 'thumbnail': None})
+        self.assertNotEqual(res['ETag'], full['ETag'])
+        res = self.client.get(url, {'fields': 'title,thumbnail',
+                                    'expand': ''},
+                              HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_similar_selected_fields(self):
+        """Test similar recipes are sparse too."""
+        other = create_recipe(user=self.user, title='Paella')
+        other.ingredients.add(self.ingredient)
+        build_similar_recipes()
+
+        res = self.client.get(similar_url(self.recipe.id),
+                              {'fields': 'id,similarity'})
+
+        self.assertEqual(res.data, [{'id': other.id, 'similarity': 0.5}])
+
+    def test_unknown_fields_error(self):
+        """Test unknown fields and relations are rejected."""
+        for params in ({'fields': 'id,secret'}, {'expand': 'user'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)), res.data)
+
+
+class ConcurrentRecipeUpdateTests(TransactionTestCase):
+    """Test recipe updates racing with other writes to the recipe"""
+
+    def setUp(self):
+        self.user = create_user(email='user@example.com', password='test123')
+        self.recipe = create_recipe(user=self.user)
+        self.tags = [Tag.objects.create(user=self.user, name=name)
+                     for name in ('Vegan', 'Quick')]
+
+    def test_links_counted_once(self):
+        """Test an update waits for links being written to the recipe"""
+        linked = threading.Event()
+
+        def link():
+            try:
+                with transaction.atomic():
+                    Recipe.objects.set_links('tags', {
+                        self.recipe.id: {tag.id for tag in self.tags},
+                    })
+                    linked.set()
+                    time.sleep(0.5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=link)
+        thread.start()
+        linked.wait(timeout=5)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.patch(detail_url(self.recipe.id), {
+            'tags': [{'name': 'Vegan'}, {'name': 'Quick'}],
+        }, format='json')
+        thread.join()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for tag in self.tags:
+            tag.refresh_from_db()
+            self.assertEqual(tag.usage_count, 1, tag.name)
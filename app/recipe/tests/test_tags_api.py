@@ -1,13 +1,15 @@
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
-from recipe.serializers import TagSerializer
+from recipe.serializers import TagDetailSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
 
@@ -51,9 +53,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         tags = Tag.objects.all().order_by('-name')
-        serializer = TagSerializer(tags, many=True)
+        serializer = TagDetailSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test list of tags is limited to authenticated user"""
@@ -64,9 +66,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
 
     def test_update_tag(self):
         """Test updating a tag"""
@@ -104,10 +106,11 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        s1 = TagSerializer(tag1)
-        s2 = TagSerializer(tag2)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        tag1.refresh_from_db()
+        s1 = TagDetailSerializer(tag1)
+        s2 = TagDetailSerializer(tag2)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_tags_unique(self):
         """Test filtered tags returns a unique list."""
@@ -130,4 +133,132 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_filter_assigned_reads_usage_count(self):
+        """Test assigned only filtering reads the maintained usage count."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=Decimal('5.00'),
+            user=self.user,
+        )
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+        sql = queries.captured_queries[-1]['sql'].upper()
+        self.assertIn('"USAGE_COUNT" > 0', sql)
+        self.assertNotIn('RECIPE_TAGS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_list_includes_usage_count(self):
+        """Test tags list the number of recipes using them."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Dinner')
+        for title in ['Pancakes', 'Porridge']:
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=5,
+                price=Decimal('5.00'),
+                user=self.user,
+            )
+            recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL)
+
+        counts = {t['name']: t['usage_count'] for t in res.data['results']}
+        self.assertEqual(counts, {'Breakfast': 2, 'Dinner': 0})
+
+    def test_order_by_usage(self):
+        """Test ordering tags by usage lists the most used first."""
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ['Breakfast', 'Dinner', 'Lunch']]
+        recipes = [
+            Recipe.objects.create(
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('5.00'),
+                user=self.user,
+            )
+            for i in range(2)
+        ]
+        recipes[0].tags.add(tags[0], tags[2])
+        recipes[1].tags.add(tags[2])
+
+        res = self.client.get(TAGS_URL, {'ordering': 'usage'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        names = [t['name'] for t in res.data['results']]
+        self.assertEqual(names, ['Lunch', 'Breakfast', 'Dinner'])
+
+    def test_invalid_ordering_error(self):
+        """Test an unknown ordering is rejected."""
+        res = self.client.get(TAGS_URL, {'ordering': 'price'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_paginated_by_cursor(self):
+        """Test tags are paginated by name with opaque cursors."""
+        for name in ['Breakfast', 'Dinner', 'Lunch']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+
+        self.assertEqual(
+            [t['name'] for t in res.data['results']],
+            ['Lunch', 'Dinner'],
+        )
+        res = self.client.get(res.data['next'])
+        self.assertEqual(
+            [t['name'] for t in res.data['results']],
+            ['Breakfast'],
+        )
+        self.assertIsNone(res.data['next'])
+
+    def test_update_tag_to_existing_name_error(self):
+        """Test renaming a tag to a name already used fails."""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='After Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'After Dinner')
+
+    def test_rename_tag_changes_recipe_etag(self):
+        """Test renaming a tag invalidates the recipes showing it."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=Decimal('5.00'),
+            user=self.user,
+        )
+        recipe.tags.add(tag)
+        recipe_url = reverse('recipe:recipe-detail', args=[recipe.id])
+        etag = self.client.get(recipe_url)['ETag']
+
+        self.client.patch(detail_url(tag.id), {'name': 'Brunch'})
+
+        res = self.client.get(recipe_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Brunch')
+
+    def test_update_tag_with_stale_etag_fails(self):
+        """Test a tag update conditioned on an old version is refused."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+
+        res = self.client.patch(
+            detail_url(tag.id),
+            {'name': 'Brunch'},
+            HTTP_IF_MATCH='"stale"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Breakfast')
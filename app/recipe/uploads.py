@@ -0,0 +1,99 @@
+"""
+Streaming upload handling for recipe images.
+"""
+import hashlib
+import io
+import warnings
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile,
+    TemporaryFileUploadHandler,
+)
+
+# Bytes buffered while waiting for a complete image header.
+HEADER_LIMIT = 256 * 1024
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Stream an uploaded image to a temporary file, checking it on the way
+
+    The image header is parsed as soon as enough of it has arrived, so
+    oversized files, unknown formats and decompression bombs are
+    rejected before the rest of the body is stored and without decoding
+    any pixel. A SHA-256 of the content is computed while it's written.
+    The reason for a rejection is kept in `error`.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+        self.max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        self.error = None
+
+    def new_file(self, field_name, file_name, content_type,
+                 content_length, charset=None, content_type_extra=None):
+        if content_length is not None and content_length > self.max_bytes:
+            self._reject(self._too_large())
+        super().new_file(field_name, file_name, content_type,
+                         content_length, charset, content_type_extra)
+        self.hash = hashlib.sha256()
+        self.header = bytearray()
+        self.image_format = None
+        self.image_size = None
+
+    def _too_large(self):
+        return (f'Ensure the image is at most '
+                f'{self.max_bytes // (1024 * 1024)} MB.')
+
+    def _reject(self, error):
+        self.error = error
+        raise SkipFile(error)
+
+    def _read_header(self, chunk):
+        """Identify the image once its header is complete"""
+        self.header += chunk
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                with Image.open(io.BytesIO(self.header)) as img:
+                    image_format, image_size = img.format, img.size
+        except Image.DecompressionBombError:
+            self._reject('Image dimensions are too large.')
+        except OSError:
+            if len(self.header) >= HEADER_LIMIT:
+                self._reject('Upload a valid image.')
+            return
+
+        width, height = image_size
+        if width * height > self.max_pixels:
+            self._reject('Image dimensions are too large.')
+        if image_format not in ALLOWED_FORMATS:
+            self._reject(f'Unsupported image format {image_format}.')
+        self.image_format, self.image_size = image_format, image_size
+        self.header = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self._reject(self._too_large())
+        if self.image_format is None:
+            self._read_header(raw_data)
+        self.hash.update(raw_data)
+
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if self.image_format is None:
+            self.error = 'Upload a valid image.'
+            file.close()
+            return None
+
+        file.image_format = self.image_format
+        file.image_size = self.image_size
+        file.content_hash = self.hash.hexdigest()
+
+        return file
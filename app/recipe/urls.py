@@ -14,5 +14,7 @@ router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 
 urlpatterns = [
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('stats/', views.UserStatsView.as_view(), name='stats'),
     path('', include(router.urls)),
 ]
@@ -1,12 +1,39 @@
+import csv
+import io
+import re
+from collections import defaultdict
+
 from rest_framework import (
     viewsets,
     mixins,
 )
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from django.db import IntegrityError, transaction
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    When,
+)
+from django.db.models.functions import Cast
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 
 from drf_spectacular.utils import (
     extend_schema,
@@ -15,17 +42,92 @@ from drf_spectacular.utils import (
     OpenApiTypes,
 )
 
+from .cache import CachedListMixin, get_list_cache, get_metrics
+from .conditional import ConditionalMixin, make_etag
+from .exports import (
+    CSVRenderer,
+    NDJSONRenderer,
+    csv_stream,
+    ndjson_stream,
+)
+from .images import enqueue_renditions
+from .imports import RecipeImporter, read_rows
+from .pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+)
 from .serializers import (
+    BULK_MAX_ITEMS,
+    PantryMatchSerializer,
+    PantrySerializer,
+    RecipeBulkDeleteSerializer,
     RecipeSerializer,
     RecipeDetailSerializer,
     TagSerializer,
+    TagDetailSerializer,
     IngredientSerializer,
+    IngredientDetailSerializer,
     RecipeImageSerializer,
+    RecipeRangeSerializer,
+    ShoppingListItemSerializer,
+    ShoppingListSerializer,
+    SimilarRecipeSerializer,
+    UserStatsSerializer,
 )
-from core.models import (Recipe,
+from .uploads import ImageUploadHandler
+from core.models import (ImageBlob,
+                         PantryEntry,
+                         Recipe,
+                         RecipeSimilarity,
                          Tag,
                          Ingredient,
+                         UserStats,
+                         SEARCH_CONFIG,
+                         SIMILAR_RECIPES_KEPT,
+                         name_words,
+                         recipe_search_vector,
                          )
+from users.authentication import CachedTokenAuthentication
+
+# Most suggestions returned for a typeahead query, and its shortest text.
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MIN_LENGTH = 2
+# Orderings of tag and ingredient lists, by `ordering` parameter.
+RECIPE_ATTR_ORDERINGS = {
+    'name': ('-name',),
+    'usage': ('-usage_count', '-name'),
+}
+# Orderings of recipe lists, by `ordering` parameter. Ids break ties so
+# cursors page through equal values exactly.
+RECIPE_ORDERINGS = {
+    f'{sign}{field}': (f'{sign}{field}', f'{sign}id')
+    for field in ('time_minutes', 'price', 'title')
+    for sign in ('', '-')
+}
+# Actions serving sparse fieldsets of recipes.
+SPARSE_ACTIONS = ('list', 'retrieve', 'similar')
+# Bounds of the recipe range filters, by parameter.
+RECIPE_RANGES = {
+    'min_time': 'time_minutes__gte',
+    'max_time': 'time_minutes__lte',
+    'min_price': 'price__gte',
+    'max_price': 'price__lte',
+}
+# Most used tags and ingredients reported in user stats.
+STATS_TOP_ITEMS = 10
+
+
+def get_ordering(request, orderings, default=None):
+    """Return the ordering fields chosen by the `ordering` parameter"""
+    ordering = request.query_params.get('ordering', default)
+    if ordering is None:
+        return None
+    if ordering not in orderings:
+        raise ValidationError({'ordering': [
+            f'Expected one of: {", ".join(orderings)}.',
+        ]})
+
+    return orderings[ordering]
 
 
 @extend_schema_view(
@@ -35,19 +137,38 @@ from core.models import (Recipe,
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipes.',
-            )
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR, enum=list(RECIPE_ATTR_ORDERINGS),
+                description='Order by name, the default, or by the number '
+                            'of recipes using the items, most used first.',
+            ),
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='Typeahead: return at most '
+                            f'{TYPEAHEAD_LIMIT} items whose name has words '
+                            'starting with the typed words, then items '
+                            'with similar names, unpaginated. '
+                            f'Needs at least {TYPEAHEAD_MIN_LENGTH} '
+                            'characters.',
+            ),
         ]
     )
 )
-class BaseRecipeAttrsViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrsViewSet(ConditionalMixin,
+                             CachedListMixin,
+                             viewsets.GenericViewSet,
                              mixins.ListModelMixin,
                              mixins.UpdateModelMixin,
                              mixins.DestroyModelMixin,
                              ):
     """Base viewset for user owned recipe attributes"""
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
 
     def get_queryset(self):
 
@@ -57,74 +178,692 @@ class BaseRecipeAttrsViewSet(viewsets.GenericViewSet,
 
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            # Read from the (user, -usage_count) index.
+            queryset = queryset.filter(usage_count__gt=0)
+
+        queryset = queryset.filter(user=self.request.user)
+        if self.action == 'list' and self._typeahead_text():
+            return self._typeahead(queryset, self._typeahead_text())
+
+        return queryset.order_by(*get_ordering(
+            self.request, RECIPE_ATTR_ORDERINGS, default='name'))
+
+    def _typeahead_text(self):
+        return self.request.query_params.get('q', '').strip()
+
+    def get_serializer_class(self):
+        # Suggestions stay as small as the typed text needs.
+        if self.action == 'list' and self._typeahead_text():
+            return self.typeahead_serializer_class
+
+        return super().get_serializer_class()
+
+    def _typeahead(self, queryset, text):
+        """Rank the items having words that start with the typed words
+
+        Exact names come first, then names starting with the text, then
+        the most used items. When fewer items match, names similar to the
+        text, such as misspellings of it, follow, most similar first. The
+        similarity search only runs then, as it scans many more names.
+        """
+        words = re.findall(r'\w+', text)
+        if len(text) < TYPEAHEAD_MIN_LENGTH or not words:
+            return queryset.none()
+        query = SearchQuery(' & '.join(f'{word}:*' for word in words),
+                            config='simple', search_type='raw')
+
+        suggestions = list(queryset.annotate(words=name_words()).filter(
+            words=query,
+        ).annotate(match=Case(
+            When(name__iexact=text, then=0),
+            When(name__istartswith=text, then=1),
+            default=2,
+            output_field=IntegerField(),
+        )).order_by('match', '-usage_count', 'name')[:TYPEAHEAD_LIMIT])
+        if len(suggestions) < TYPEAHEAD_LIMIT:
+            # Read from the trigram index on names.
+            suggestions += queryset.filter(
+                name__trigram_similar=text,
+            ).exclude(
+                pk__in=[item.pk for item in suggestions],
+            ).annotate(
+                similarity=TrigramSimilarity('name', text),
+            ).order_by(
+                '-similarity', '-usage_count', 'name',
+            )[:TYPEAHEAD_LIMIT - len(suggestions)]
+
+        return suggestions
+
+    def paginate_queryset(self, queryset):
+        if self.action == 'list' and self._typeahead_text():
+            return None
+
+        return super().paginate_queryset(queryset)
+
+    def _linked_recipes(self, instance):
+        """Return the recipes showing an attribute"""
+        return Recipe.objects.filter(**{self.recipe_field: instance})
+
+    def _touch_recipes(self, recipes):
+        """Mark recipes as changed and reindex their names for search"""
+        Recipe.objects.filter(pk__in=recipes).update(
+            updated_at=timezone.now(),
+            search_vector=recipe_search_vector(),
+        )
+
+    def perform_update(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+                self._touch_recipes(
+                    self._linked_recipes(serializer.instance).values('id'))
+        except IntegrityError:
+            raise ValidationError({'name': ['This name is already in use.']})
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # The links are gone once the attribute is deleted.
+            recipe_ids = list(self._linked_recipes(instance).values_list(
+                'id', flat=True))
+            instance.delete()
+            self._touch_recipes(recipe_ids)
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
+
+RECIPE_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of tag IDs to filter'
+    ),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient IDs to filter'
+    ),
+    OpenApiParameter(
+        'tags_all',
+        OpenApiTypes.STR,
+        description='Comma separated list of tag IDs all required'
+    ),
+    OpenApiParameter(
+        'ingredients_all',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient IDs all required'
+    ),
+    OpenApiParameter(
+        'tags_exclude',
+        OpenApiTypes.STR,
+        description='Comma separated list of tag IDs to leave out'
+    ),
+    OpenApiParameter(
+        'ingredients_exclude',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient IDs to leave out'
+    ),
+    OpenApiParameter(
+        'min_time',
+        OpenApiTypes.INT,
+        description='Shortest preparation time in minutes'
+    ),
+    OpenApiParameter(
+        'max_time',
+        OpenApiTypes.INT,
+        description='Longest preparation time in minutes'
+    ),
+    OpenApiParameter(
+        'min_price',
+        OpenApiTypes.DECIMAL,
+        description='Lowest price'
+    ),
+    OpenApiParameter(
+        'max_price',
+        OpenApiTypes.DECIMAL,
+        description='Highest price'
+    ),
+    OpenApiParameter(
+        'ordering',
+        OpenApiTypes.STR,
+        enum=list(RECIPE_ORDERINGS),
+        description='Order by a field, descending when prefixed with '
+                    '`-`, instead of newest or best matches first'
+    ),
+]
+
+RECIPE_FIELDSET_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated list of the fields to return, all '
+                    'by default'
+    ),
+    OpenApiParameter(
+        'expand',
+        OpenApiTypes.STR,
+        description='Comma separated list of the tags and ingredients '
+                    'fields to nest, all by default, the others list ids'
+    ),
+]
 
 
 @extend_schema_view(
     list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Comma separated list of tag IDs to filter'
-            ),
+        parameters=RECIPE_FILTER_PARAMETERS + [
             OpenApiParameter(
-                'ingredients',
+                'search',
                 OpenApiTypes.STR,
-                description='Comma separated list of ingredient IDs to filter'
+                description='Search titles, descriptions, tags and '
+                            'ingredients, best matches first',
             ),
-        ]
-    )
+        ] + RECIPE_FIELDSET_PARAMETERS
+    ),
+    retrieve=extend_schema(parameters=RECIPE_FIELDSET_PARAMETERS),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalMixin,
+                    CachedListMixin,
+                    viewsets.ModelViewSet):
 
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     serializer_class = RecipeDetailSerializer
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.defer('search_vector')
+    pagination_class = RecipeCursorPagination
+    read_only_actions = ('pantry', 'shopping_list')
 
     def _params_to_ints(self, qs):
         """Convert a list of string IDs to a list of integers"""
         return [int(str_id) for str_id in qs.split(',') if str_id.isdigit()]
 
+    def _filter_links(self, queryset, field_name):
+        """Filter by any, all or none of the objects of a recipe M2M field"""
+        field = Recipe._meta.get_field(field_name)
+        links = field.remote_field.through.objects
+        obj_in = f'{field.m2m_reverse_name()}__in'
+        params = self.request.query_params
+
+        any_of = params.get(field_name)
+        if any_of:
+            queryset = queryset.filter(Exists(links.filter(
+                recipe=OuterRef('pk'),
+                **{obj_in: self._params_to_ints(any_of)},
+            )))
+        all_of = set(self._params_to_ints(params.get(f'{field_name}_all',
+                                                     '')))
+        if all_of:
+            # Relational division: recipes linked to every one of the ids.
+            queryset = queryset.filter(pk__in=links.filter(
+                **{obj_in: all_of},
+            ).values('recipe').annotate(
+                linked=Count('*'),
+            ).filter(linked=len(all_of)).values('recipe'))
+        none_of = self._params_to_ints(params.get(f'{field_name}_exclude',
+                                                  ''))
+        if none_of:
+            queryset = queryset.filter(~Exists(links.filter(
+                recipe=OuterRef('pk'),
+                **{obj_in: none_of},
+            )))
+
+        return queryset
+
+    def _filter_ranges(self, queryset):
+        """Filter by the bounds given on time and price"""
+        serializer = RecipeRangeSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        return queryset.filter(**{
+            RECIPE_RANGES[param]: value
+            for param, value in serializer.validated_data.items()
+        })
+
     def get_queryset(self):
 
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        queryset = self._filter_links(self.queryset, 'tags')
+        queryset = self._filter_links(queryset, 'ingredients')
+        queryset = self._filter_ranges(queryset)
+        queryset = queryset.filter(user=self.request.user)
+        ordering = get_ordering(self.request, RECIPE_ORDERINGS)
+        search = self.request.query_params.get('search')
+        if search:
+            query = SearchQuery(search, config=SEARCH_CONFIG,
+                                search_type='websearch')
+            # Ranks are read as doubles so cursors compare them exactly.
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F('search_vector'), query),
+                          FloatField()),
+            ).order_by(*ordering or ('-rank', '-id'))
+        else:
+            queryset = queryset.order_by(*ordering or ('-id',))
+
+        if self.action in ('list', 'retrieve'):
+            queryset = self._select_fields(queryset)
+        # Details load their links lazily, after any conditional check.
+        if self.action not in ('retrieve', 'upload_image', 'export',
+                               'similar'):
+            queryset = self._prefetch_relations(queryset, self._fieldset())
+
+        return queryset
+
+    def _fieldset(self):
+        """Return the fields and the relations to nest asked for
+
+        Either is None when not given, which stands for all of them.
+        """
+        fieldset = {'fields': None, 'expand': None}
+        if self.action not in SPARSE_ACTIONS:
+            return fieldset
+
+        choices = {
+            'fields': self.get_serializer_class().Meta.fields,
+            'expand': RecipeSerializer.expandable_fields,
+        }
+        for param, names in choices.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            selected = {name.strip() for name in value.split(',')} - {''}
+            unknown = selected - set(names)
+            if unknown:
+                raise ValidationError({param: [
+                    f'Unknown fields: {", ".join(sorted(unknown))}.',
+                ]})
+            fieldset[param] = selected
+
+        return fieldset
+
+    def _select_fields(self, queryset):
+        """Load only the columns read by the fields asked for"""
+        fields = self._fieldset()['fields']
+        if fields is None:
+            return queryset
+
+        columns = self.get_serializer_class().columns(fields)
+        if self.action == 'retrieve':
+            # Object ETags are derived from it.
+            columns.add('updated_at')
+
+        return queryset.only('id', *columns)
+
+    def _prefetch_relations(self, queryset, fieldset=None):
+        """Load nested tags and ingredients in one query each
+
+        With a fieldset, only the relations asked for are loaded, and
+        only their ids when they aren't nested.
+        """
+        fieldset = fieldset or {}
+        fields, expand = fieldset.get('fields'), fieldset.get('expand')
+        prefetches = []
+        for name in RecipeSerializer.expandable_fields:
+            if fields is not None and name not in fields:
+                continue
+            nested = expand is None or name in expand
+            columns = ('id', 'name') if nested else ('id',)
+            model = Recipe._meta.get_field(name).related_model
+            prefetches.append(Prefetch(
+                name, queryset=model.objects.only(*columns)))
+
+        return queryset.prefetch_related(*prefetches)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **self._fieldset()}
+
+    def get_object_etag(self, obj):
+        etag = super().get_object_etag(obj)
+        fieldset = self._fieldset()
+        if not any(value is not None for value in fieldset.values()):
+            return etag
+
+        # Sparse representations are tagged apart from the full one.
+        return make_etag(etag, *(
+            None if value is None else sorted(value)
+            for value in fieldset.values()
+        ))
+
+    def paginate_queryset(self, queryset):
+        """Page through ids alone, then load the rows of the page
+
+        Selecting only the ordering columns lets Postgres walk the
+        (user, -id) index without reading the table. Selecting whole rows
+        can make it scan the primary key backwards instead, which goes
+        through every newer recipe of other users first.
+        """
+        fields = {field.lstrip('-') for field in queryset.query.order_by}
+        page = super().paginate_queryset(
+            queryset.prefetch_related(None).only(
+                'id', *(fields & {f.name for f in Recipe._meta.fields})),
+        )
+        if page is None:
+            return None
+        rows = queryset.in_bulk([recipe.id for recipe in page])
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-id').distinct()
+        return [rows[recipe.id] for recipe in page]
 
     def get_serializer_class(self):
         if self.action == 'list':
             return RecipeSerializer
         elif self.action == 'upload_image':
             return RecipeImageSerializer
+        elif self.action == 'similar':
+            return SimilarRecipeSerializer
 
         return self.serializer_class
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def _bulk_items(self, request):
+        """Return the request body as a bounded list of items"""
+        if not isinstance(request.data, list):
+            raise ValidationError({
+                'non_field_errors': ['Expected a list of items.'],
+            })
+        if len(request.data) > BULK_MAX_ITEMS:
+            raise ValidationError({
+                'non_field_errors': [
+                    f'Ensure this list has at most {BULK_MAX_ITEMS} items.',
+                ],
+            })
+
+        return request.data
+
+    def _bulk_response(self, ids, status_code):
+        """Return the given recipes serialized in request order"""
+        recipes = self._prefetch_relations(
+            self.queryset.filter(user=self.request.user)
+        ).in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids],
+            many=True,
+        )
+
+        return Response(serializer.data, status=status_code)
+
+    @extend_schema(
+        request=RecipeDetailSerializer(many=True),
+        responses=RecipeDetailSerializer(many=True),
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """Create many recipes in a single transaction"""
+        serializer = self.get_serializer(
+            data=self._bulk_items(request),
+            many=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            recipes = serializer.save(user=request.user)
+
+        return self._bulk_response(
+            [recipe.id for recipe in recipes],
+            status.HTTP_201_CREATED,
+        )
+
+    @extend_schema(
+        request=RecipeDetailSerializer(many=True),
+        responses=RecipeDetailSerializer(many=True),
+    )
+    @bulk.mapping.patch
+    def bulk_partial_update(self, request):
+        """Partially update many recipes identified by their ids"""
+        items = self._bulk_items(request)
+        ids = [
+            item.get('id') if isinstance(item, dict) else None
+            for item in items
+        ]
+        ids = [
+            recipe_id
+            if isinstance(recipe_id, int) and not isinstance(recipe_id, bool)
+            else None
+            for recipe_id in ids
+        ]
+        recipes = self._prefetch_relations(
+            self.queryset.filter(user=request.user)
+        ).in_bulk([recipe_id for recipe_id in ids if recipe_id is not None])
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+        errors = []
+        seen = set()
+        for recipe_id in ids:
+            if recipe_id not in recipes:
+                errors.append({'id': ['Not found.']})
+            elif recipe_id in seen:
+                errors.append({'id': ['Duplicate id.']})
+            else:
+                errors.append({})
+            seen.add(recipe_id)
+        if any(errors):
+            raise ValidationError(errors)
+
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids],
+            data=items,
+            many=True,
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+
+        return self._bulk_response(ids, status.HTTP_200_OK)
+
+    @extend_schema(request=RecipeBulkDeleteSerializer)
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """Delete many recipes by id"""
+        serializer = RecipeBulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        with transaction.atomic():
+            recipes = self.queryset.filter(user=request.user, id__in=ids)
+            deleted = set(
+                recipes.select_for_update().values_list('id', flat=True)
+            )
+            recipes.delete()
+
+        return Response({
+            'deleted': [recipe_id for recipe_id in ids
+                        if recipe_id in deleted],
+            'not_found': [recipe_id for recipe_id in ids
+                          if recipe_id not in deleted],
+        })
+
+    @extend_schema(
+        request=PantrySerializer,
+        responses=PantryMatchSerializer(many=True),
+    )
+    @action(methods=['POST'], detail=False, url_path='pantry')
+    def pantry(self, request):
+        """Rank the user's recipes by the share of ingredients on hand
+
+        Coverage is summed from the index of the pantry matrix alone. Only
+        the returned recipes are then loaded, with their missing
+        ingredients.
+        """
+        serializer = PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pantry = list(Ingredient.objects.filter(
+            user=request.user,
+            id__in=serializer.validated_data['ingredients'],
+        ).values_list('id', flat=True))
+
+        matches = list(PantryEntry.objects.match(pantry)[
+            :serializer.validated_data['limit']])
+        recipe_ids = [match['recipe_id'] for match in matches]
+        titles = dict(Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', 'title'))
+        missing = defaultdict(list)
+        entries = PantryEntry.objects.filter(
+            recipe__in=recipe_ids,
+        ).exclude(
+            ingredient__in=pantry,
+        ).select_related('ingredient').order_by('ingredient__name')
+        for entry in entries:
+            missing[entry.recipe_id].append(entry.ingredient)
+
+        serializer = PantryMatchSerializer([
+            {
+                'id': match['recipe_id'],
+                'title': titles[match['recipe_id']],
+                'coverage': match['coverage'],
+                'missing': missing[match['recipe_id']],
+            }
+            for match in matches
+        ], many=True)
+
+        return Response(serializer.data)
+
+    @extend_schema(
+        request=ShoppingListSerializer,
+        responses=ShoppingListItemSerializer(many=True),
+    )
+    @action(methods=['POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """List the ingredients of the given recipes once each, by name
+
+        Each ingredient counts the given recipes using it, in a single
+        grouped query over the recipe ingredient links.
+        """
+        serializer = ShoppingListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ingredients = Ingredient.objects.filter(
+            user=request.user,
+            recipe__user=request.user,
+            recipe__id__in=serializer.validated_data['recipes'],
+        ).annotate(
+            recipes=Count('recipe'),
+        ).only('id', 'name').order_by('name', 'id')
+
+        return Response(
+            ShoppingListItemSerializer(ingredients, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of recipes, at most '
+                            f'{SIMILAR_RECIPES_KEPT}',
+            ),
+        ] + RECIPE_FIELDSET_PARAMETERS,
+        responses=SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """List the recipes sharing the most tags and ingredients
+
+        Lists are precomputed by the build_similar_recipes command. After
+        the recipe, or a recipe sharing a tag or ingredient with it,
+        changes links, the previous list is served until it is rebuilt.
+        Recipes not built yet have no similar recipes.
+        """
+        recipe = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 SIMILAR_RECIPES_KEPT))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = min(max(limit, 1), SIMILAR_RECIPES_KEPT)
+
+        similarity = RecipeSimilarity.objects.for_recipe(recipe)
+        scores = dict(zip(similarity.similar_ids[:limit],
+                          similarity.scores[:limit]))
+        recipes = self._prefetch_relations(
+            self._select_fields(self.queryset.filter(user=request.user)),
+            self._fieldset(),
+        ).in_bulk(list(scores))
+        similar = []
+        for recipe_id, score in scores.items():
+            if recipe_id in recipes:
+                recipes[recipe_id].similarity = score
+                similar.append(recipes[recipe_id])
+
+        return Response(self.get_serializer(similar, many=True).data)
+
+    @extend_schema(parameters=RECIPE_FILTER_PARAMETERS)
+    @action(methods=['GET'], detail=False, url_path='export',
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Stream the user's recipes as NDJSON or CSV"""
+        renderer = request.accepted_renderer
+        stream = csv_stream if renderer.format == 'csv' else ndjson_stream
+        response = StreamingHttpResponse(
+            stream(self.get_queryset()),
+            content_type=f'{renderer.media_type}; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{renderer.format}"'
+        )
+
+        return response
+
+    @extend_schema(
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {'file': {'type': 'string',
+                                        'format': 'binary'}},
+            },
+        },
+    )
+    @action(methods=['POST'], detail=False, url_path='import',
+            parser_classes=[MultiPartParser])
+    def import_recipes(self, request):
+        """Import recipes from an uploaded NDJSON or CSV file"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+
+        file_format = (
+            'csv' if upload.name.lower().endswith('.csv') else 'ndjson'
+        )
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        importer = RecipeImporter(request.user)
+        try:
+            importer.run(read_rows(stream, file_format))
+        except (UnicodeDecodeError, csv.Error) as exc:
+            # Batches read before the error stay imported.
+            return Response({
+                'file': [f'The file could not be read: {exc}'],
+                'imported': importer.imported,
+                'failed': importer.failed,
+                'errors': importer.errors,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'imported': importer.imported,
+            'failed': importer.failed,
+            'errors': importer.errors,
+        }, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            parser_classes=[MultiPartParser])
     def upload_image(self, request, pk=None):
         recipe = self.get_object()
-        serializer = self.get_serializer(recipe, data=request.data)
+        handler = ImageUploadHandler(request._request)
+        request.upload_handlers = [handler]
+        data = request.data
+        if handler.error:
+            return Response({'image': [handler.error]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(recipe, data=data)
 
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                # Read the renditions a running job may have just stored.
+                Recipe.objects.filter(pk=recipe.pk).lock()
+                recipe.refresh_from_db(fields=['image', 'image_renditions'])
+                previous = recipe.image_names
+                # Renditions of the previous image must not be served.
+                recipe.image_renditions = {}
+                recipe = serializer.save()
+                ImageBlob.objects.acquire([recipe.image.name])
+                ImageBlob.objects.release(previous)
+                enqueue_renditions(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -132,7 +871,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
 class TagViewSet(BaseRecipeAttrsViewSet):
     queryset = Tag.objects.all()
-    serializer_class = TagSerializer
+    serializer_class = TagDetailSerializer
+    typeahead_serializer_class = TagSerializer
+    recipe_field = 'tags'
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -141,4 +882,41 @@ class TagViewSet(BaseRecipeAttrsViewSet):
 class IngredientViewSet(BaseRecipeAttrsViewSet):
 
     queryset = Ingredient.objects.all()
-    serializer_class = IngredientSerializer
+    serializer_class = IngredientDetailSerializer
+    typeahead_serializer_class = IngredientSerializer
+    recipe_field = 'ingredients'
+
+
+class CacheStatsView(APIView):
+    """Report list cache metrics counted by every worker process"""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'backend': type(get_list_cache()).__name__,
+            **get_metrics(),
+        })
+
+
+class UserStatsView(APIView):
+    """Report the counters of the user's recipes, tags and ingredients
+
+    Every figure is read from counters kept by the write paths, so the
+    cost doesn't grow with the number of recipes.
+    """
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses=UserStatsSerializer)
+    def get(self, request):
+        stats = (UserStats.objects.filter(user=request.user).first()
+                 or UserStats(user=request.user))
+        for attr, model in (('top_tags', Tag),
+                            ('top_ingredients', Ingredient)):
+            setattr(stats, attr, model.objects.filter(
+                user=request.user,
+                usage_count__gt=0,
+            ).order_by('-usage_count', 'name')[:STATS_TOP_ITEMS])
+
+        return Response(UserStatsSerializer(stats).data)
@@ -0,0 +1,67 @@
+"""
+Token authentication with cached lookups.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.authentication import TokenAuthentication
+
+# Backends whose entries other worker processes can't see, nor drop.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def _token_cache():
+    """Return the token cache, or None when it is local to the process
+
+    A token revoked through one worker would keep authenticating on the
+    others until its entry expires, so tokens are looked up every time
+    instead.
+    """
+    cache = caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+    if isinstance(cache, PROCESS_LOCAL_BACKENDS):
+        return None
+
+    return cache
+
+
+def _token_key(key):
+    return f'auth-token:{key}'
+
+
+def _user_key(user_id):
+    return f'auth-token-user:{user_id}'
+
+
+def forget_user_token(user_id):
+    """Drop the cached token of a user, so it is looked up again"""
+    cache = _token_cache()
+    if cache is None:
+        return
+    key = cache.get(_user_key(user_id))
+    if key is not None:
+        cache.delete_many([_token_key(key), _user_key(user_id)])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication remembering resolved tokens for a while
+
+    The token and its user are cached for AUTH_TOKEN_CACHE_TIMEOUT
+    seconds in a cache shared by the workers, so most requests skip the
+    token and user query. Entries are dropped when the user is saved or
+    the token deleted, see `users.signals`.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = _token_cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+        token = cache.get(_token_key(key))
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set_many({
+                _token_key(key): token,
+                _user_key(user.pk): key,
+            }, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+        return (token.user, token)
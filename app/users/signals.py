@@ -0,0 +1,20 @@
+"""
+Signal handlers keeping cached authentication in sync.
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_user_token
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_token_on_user_change(sender, instance, **kwargs):
+    """Password, activity or profile changes must not be served stale"""
+    forget_user_token(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_user_token(instance.user_id)
@@ -2,10 +2,15 @@
 Test for the user api
 """
 
+import shutil
+import tempfile
+
+from django.conf import settings
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
@@ -13,6 +18,7 @@ from rest_framework import status
 CREATE_USER_URL = reverse('users:create')
 TOKEN_URL = reverse('users:token')
 ME_URL = reverse('users:me')
+LOGOUT_URL = reverse('users:logout')
 
 
 def create_user(**params):
@@ -150,3 +156,79 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class TokenAuthenticationCacheTests(TestCase):
+    """Test token lookups are cached and invalidated"""
+
+    def setUp(self):
+        # Files are shared by the worker processes of a host.
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        shared = self.settings(CACHES={**settings.CACHES, 'auth': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir,
+        }})
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """Test repeated requests skip the token query"""
+        with self.assertNumQueries(2):
+            self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_process_local_cache_not_used(self):
+        """Test tokens aren't cached where other workers can't drop them"""
+        with self.settings(CACHES={**settings.CACHES, 'auth': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            self.client.get(ME_URL)
+
+            with self.assertNumQueries(2):
+                res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_inactive_user_rejected_after_cached(self):
+        """Test deactivating a user takes effect immediately"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_refreshes_cached_user(self):
+        """Test updating the profile drops the cached user"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New Name', 'password': 'new123'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+    def test_logout_revokes_token(self):
+        """Test a token can't be used after logging out"""
+        self.client.get(ME_URL)
+
+        res = self.client.post(LOGOUT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -9,4 +9,5 @@ urlpatterns = [
     path('create/', views.CreateUserAPIView.as_view(), name='create'),
     path('token/', views.CreateTokenAPIView.as_view(), name='token'),
     path('me/', views.ManageUserAPIView.as_view(), name='me'),
+    path('logout/', views.LogoutAPIView.as_view(), name='logout'),
 ]
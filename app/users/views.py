@@ -1,11 +1,15 @@
 """ Views for the user API"""
 
+from django.contrib.auth import get_user_model
 from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework import status
 
+from .authentication import CachedTokenAuthentication
 from .serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -22,9 +26,21 @@ class CreateTokenAPIView(ObtainAuthToken):
 
 class ManageUserAPIView(RetrieveUpdateAPIView):
     serializer_class = UserSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
+        # The authenticated user may come from the token cache, reload it
+        # so saving doesn't write back stale fields.
+        return get_user_model().objects.get(pk=self.request.user.pk)
 
-        return self.request.user
+
+class LogoutAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Delete the token used for the request"""
+        request.auth.delete()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)